@@ -0,0 +1,241 @@
+# -*- coding:utf-8 -*-
+
+"""
+Performance benchmarks of the network module : SGD training throughput, feedforward latency, evaluation throughput, mnist loading time/memory and model loading time.
+The results are written in a JSON file and compared with a stored baseline : any metric worse than the baseline by more than the threshold is reported as a regression (and the script exits with an error code).
+The benchmarks run without display, on synthetic data of the mnist shape (or on the mnist data with --mnist, when it is available).
+The baselines of the two settings, measured on synthetic data, are stored in the repository : benchmarks/baseline.json for the full run and benchmarks/baseline_quick.json for --quick,
+which the runs compare with by default. They were measured on a single machine : store the baselines of your own machine with --save-baseline before comparing changes with them.
+
+Usage (from the root of the project) :
+    python benchmarks/run_benchmarks.py [--quick] [--mnist] [--output results.json] [--baseline baseline.json] [--threshold 0.2] [--save-baseline]
+"""
+
+import os
+import sys
+os.environ.setdefault("MPLBACKEND", "Agg")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, ROOT)
+sys.path.insert(1, os.path.join(ROOT, "hd_recognition"))
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import pickle
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+import mnist_loader
+import network
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# SGD cases : each one changes a single hyper-parameter of the base case
+BASE_CASE = {'sizes': [784, 30, 10], 'activation_function_name': 'sigmoid', 'regu_name': None, 'dropout_value': None, 'mini_batch_size': 10}
+SGD_VARIATIONS = [
+    {},
+    {'sizes': [784, 100, 10]},
+    {'sizes': [784, 36, 36, 10]},
+    {'activation_function_name': 'relu'},
+    {'activation_function_name': 'tanh'},
+    {'regu_name': 'softmax'},
+    {'regu_name': 'normalization'},
+    {'dropout_value': 0.2},
+    {'mini_batch_size': 1},
+    {'mini_batch_size': 50},
+]
+
+
+def mnist_available():
+    return mnist_loader.arrays_exist() or os.path.exists(os.path.join(mnist_loader.DATA_DIRECTORY, "mnist.pkl.gz"))
+
+
+def load_benchmark_data(n_training, n_test, use_mnist = False):
+    # Returns (training_data, test_data, source) as (inputs, labels) arrays, from mnist when it is asked for and available
+    if use_mnist and mnist_available():
+        training_data, validation_data, test_data = mnist_loader.load_data()
+        return ((training_data[0][:n_training], training_data[1][:n_training]), (test_data[0][:n_test], test_data[1][:n_test]), "mnist")
+    return (synthetic_data(n_training), synthetic_data(n_test), "synthetic")
+
+
+def synthetic_data(n):
+    return (np.random.rand(n, 784).astype(np.float32), np.random.randint(0, 10, n))
+
+
+def case_name(case):
+    return "sizes={} activation={} regu={} dropout={} batch={}".format(case['sizes'], case['activation_function_name'], case['regu_name'], case['dropout_value'], case['mini_batch_size'])
+
+
+def metric(name, value, unit, higher_is_better):
+    return {'name': name, 'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def bench_sgd(training_data, repeat):
+    results = []
+    n = network.data_length(training_data)
+    for variation in SGD_VARIATIONS:
+        case = dict(BASE_CASE)
+        case.update(variation)
+        timings = []
+        for k in range(repeat):
+            net = network.Network("bench", case['sizes'], case['activation_function_name'], case['regu_name'])
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                net.SGD(training_data, 1, case['mini_batch_size'], eta=0.5, verbose=False, dropout_value=case['dropout_value'])
+            timings.append(time.perf_counter() - start)
+        results.append(metric("SGD throughput [{}]".format(case_name(case)), n / min(timings), "samples/s", True))
+    return results
+
+
+def bench_feedforward(test_data, samples):
+    net = network.Network("bench", [784, 30, 10])
+    inputs = test_data[0]
+    timings = []
+    for k in range(samples):
+        x = inputs[k % len(inputs)].reshape(784, 1)
+        start = time.perf_counter()
+        net.feedforward(x)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1e6
+    return [metric("feedforward latency p50", float(np.percentile(timings, 50)), "us", False),
+            metric("feedforward latency p99", float(np.percentile(timings, 99)), "us", False)]
+
+
+def bench_evaluate(test_data, repeat):
+    net = network.Network("bench", [784, 30, 10])
+    timings = []
+    for k in range(repeat):
+        start = time.perf_counter()
+        net.evaluate(test_data)
+        timings.append(time.perf_counter() - start)
+    return [metric("evaluate throughput", network.data_length(test_data) / min(timings), "samples/s", True)]
+
+
+def bench_loader(n_examples, use_mnist = False):
+    # Times load_data_wrapper on the real mnist file when it is asked for and there, and on a synthetic file of n_examples per set otherwise
+    directory = None
+    if not (use_mnist and mnist_available()):
+        directory = tempfile.mkdtemp()
+        sets = tuple((np.random.rand(n, 784).astype(np.float32), np.random.randint(0, 10, n)) for n in (n_examples, n_examples // 5, n_examples // 5))
+        with gzip.open(os.path.join(directory, "mnist.pkl.gz"), "wb") as file:
+            pickle.dump(sets, file)
+    data_directory = mnist_loader.DATA_DIRECTORY
+    try:
+        if directory:
+            mnist_loader.DATA_DIRECTORY = directory
+        tracemalloc.start()
+        start = time.perf_counter()
+        training_data, validation_data, test_data = mnist_loader.load_data_wrapper()
+        training_data, validation_data, test_data = list(training_data), list(validation_data), list(test_data)
+        duration = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        mnist_loader.DATA_DIRECTORY = data_directory
+        if directory:
+            shutil.rmtree(directory)
+    return [metric("load_data_wrapper time", duration, "s", False),
+            metric("load_data_wrapper peak memory", peak / 2**20, "MiB", False)]
+
+
+def bench_model_load(repeat):
+    # Compares the loading of a pickled model with the compact model format, read or memory-mapped
+    net = network.Network("bench", [784, 100, 100, 10])
+    directory = tempfile.mkdtemp()
+    pickle_path = os.path.join(directory, "bench.pickle")
+    model_path = os.path.join(directory, "bench.model")
+    try:
+        with open(pickle_path, "wb") as file:
+            pickle.Pickler(file).dump(net)
+        net.save(model_path)
+        loaders = [("pickle model load time", lambda: network.Network.load(pickle_path)),
+                   ("model file load time", lambda: network.Network.load(model_path)),
+                   ("memory-mapped model file load time", lambda: network.Network.load(model_path, mmap_mode='r'))]
+        results = []
+        for name, load in loaders:
+            timings = []
+            for k in range(repeat):
+                start = time.perf_counter()
+                load()
+                timings.append(time.perf_counter() - start)
+            results.append(metric(name, min(timings) * 1e3, "ms", False))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Returns the list of regression messages of the results with respect to the baseline
+    reference = {m['name']: m for m in baseline['metrics']}
+    regressions = []
+    for m in results['metrics']:
+        if m['name'] not in reference:
+            continue
+        old = reference[m['name']]['value']
+        if old == 0:
+            continue
+        change = (m['value'] - old) / old
+        if (m['higher_is_better'] and change < -threshold) or (not m['higher_is_better'] and change > threshold):
+            regressions.append("{} : {:.4g} {} (baseline {:.4g}, {:+.1f}%)".format(m['name'], m['value'], m['unit'], old, 100 * change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance benchmarks of the network module")
+    parser.add_argument("--quick", action="store_true", help="smaller data-sets and fewer repetitions")
+    parser.add_argument("--mnist", action="store_true", help="run on the mnist data (when it is available) instead of synthetic data")
+    parser.add_argument("--output", default=os.path.join(BENCHMARKS_DIRECTORY, "results.json"))
+    parser.add_argument("--baseline", default=None, help="baseline file (benchmarks/baseline.json by default, benchmarks/baseline_quick.json with --quick)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change beyond which a metric is a regression (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+    if args.baseline is None:
+        args.baseline = os.path.join(BENCHMARKS_DIRECTORY, "baseline_quick.json" if args.quick else "baseline.json")
+
+    np.random.seed(0)
+    n_training, n_test, repeat = (1000, 1000, 1) if args.quick else (10000, 10000, 3)
+    training_data, test_data, source = load_benchmark_data(n_training, n_test, args.mnist)
+    metrics = []
+    for bench in (lambda: bench_sgd(training_data, repeat),
+                  lambda: bench_feedforward(test_data, 1000 if args.quick else 10000),
+                  lambda: bench_evaluate(test_data, repeat),
+                  lambda: bench_loader(n_training, args.mnist),
+                  lambda: bench_model_load(5 if args.quick else 20)):
+        for m in bench():
+            print("{:<100} {:>14.4g} {}".format(m['name'], m['value'], m['unit']))
+            metrics.append(m)
+    results = {'data': source, 'quick': args.quick, 'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(), 'metrics': metrics}
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print("\nResults written in {}".format(args.output))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print("Baseline written in {}".format(args.baseline))
+        return 0
+    if not os.path.exists(args.baseline):
+        print("The baseline {} doesn't exist (run with --save-baseline to store it)".format(args.baseline))
+        return 2
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)
+    if baseline.get('data') != source or baseline.get('quick') != args.quick:
+        print("Warning : the baseline was measured on other settings (data = {}, quick = {})".format(baseline.get('data'), baseline.get('quick')))
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("\n{} regression(s) beyond {:.0f}% :".format(len(regressions), 100 * args.threshold))
+        for regression in regressions:
+            print("- " + regression)
+        return 1
+    print("No regression beyond {:.0f}% with respect to the baseline".format(100 * args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# -*- coding:utf-8 -*-
+
+"""
+Bounded memory of the best states of a network during its training.
+A CheckpointKeeper keeps the k best states by a score (the higher the better) in k parameter buffers allocated once, or in k model files of a directory : a new state replaces the worst kept one in O(log k) thanks to a heap.
+It can also keep an exponential moving average of the weights and biases, which is often a better model than any single state of the training.
+It is used through the "optimize_accuracy", "keep_best", "checkpoint_directory" and "ema_decay" arguments of Network.SGD
+"""
+
+import heapq
+import itertools
+import os
+import numpy as np
+from network import write_model_file, read_model_file
+
+
+class CheckpointKeeper():
+
+    def __init__(self, net, k = 1, directory = None, ema_decay = None):
+        # With a directory, the states are written in model files instead of being kept in memory
+        if k < 1:
+            raise ValueError("the number of kept states must be at least 1")
+        self.net = net
+        self.k = int(k)
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The heap holds (score, -order, slot) tuples : the worst state is at its top, and the latest of two states of the same score is the worst, so that the arrays are never compared
+        self.heap = []
+        self.order = itertools.count()
+        self.slots = []
+        self.tags = {}
+        self.ema_decay = ema_decay
+        self.ema = None
+        if ema_decay is not None:
+            self.ema = ([b.astype(net.dtype) for b in net.biases], [w.astype(net.dtype) for w in net.weights])
+            self.scratch = ([np.empty_like(b) for b in self.ema[0]], [np.empty_like(w) for w in self.ema[1]])
+
+    def offer(self, score, biases, weights, tag = None):
+        # Keeps a copy of the state if it is among the k best ones, and tells if it was kept
+        if len(self.heap) < self.k:
+            slot = len(self.heap)
+            if not self.directory:
+                self.slots.append(([np.empty_like(b) for b in biases], [np.empty_like(w) for w in weights]))
+            heapq.heappush(self.heap, (score, -next(self.order), slot))
+        elif score > self.heap[0][0]:
+            slot = heapq.heapreplace(self.heap, (score, -next(self.order), self.heap[0][2]))[2]
+        else:
+            return False
+        self.tags[slot] = tag
+        if self.directory:
+            header = self.net.model_header()
+            header['score'] = score
+            write_model_file(self.slot_path(slot), header, [('biases', b) for b in biases] + [('weights', w) for w in weights])
+        else:
+            for kept, array in zip(self.slots[slot][0] + self.slots[slot][1], list(biases) + list(weights)):
+                np.copyto(kept, array)
+        return True
+
+    def update_ema(self, biases, weights):
+        # ema = decay * ema + (1 - decay) * parameters, computed in place
+        for ema, scratch, array in zip(self.ema[0] + self.ema[1], self.scratch[0] + self.scratch[1], list(biases) + list(weights)):
+            np.multiply(array, 1 - self.ema_decay, out=scratch)
+            ema *= self.ema_decay
+            ema += scratch
+
+    def checkpoints(self):
+        # Returns the kept states as (score, tag, biases, weights) tuples, from the best one
+        return [(score, self.tags[slot]) + self.state(slot) for score, order, slot in sorted(self.heap, reverse=True)]
+
+    def best(self):
+        if not self.heap:
+            return None
+        score, order, slot = max(self.heap)
+        return (score, self.tags[slot]) + self.state(slot)
+
+    def state(self, slot):
+        if self.directory:
+            header, arrays = read_model_file(self.slot_path(slot))
+            return (arrays['biases'], arrays['weights'])
+        return self.slots[slot]
+
+    def restore(self, net = None):
+        # Gives the network (by default the one of the keeper) a copy of the best state, and returns its (score, tag)
+        net = net or self.net
+        score, tag, biases, weights = self.best()
+        net.biases = [b.copy() for b in biases]
+        net.weights = [w.copy() for w in weights]
+        return score, tag
+
+    def slot_path(self, slot):
+        return os.path.join(self.directory, "checkpoint_{}.model".format(slot))
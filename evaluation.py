@@ -0,0 +1,91 @@
+# -*- coding:utf-8 -*-
+
+"""
+Scheduling of the evaluations made during the training, so that they slow down the training as little as possible.
+An EvaluationScheduler can :
+    - score a snapshot of the weights and biases on a background thread while the training goes on (numpy's matrix products release the GIL)
+    - score the intermediate flags on a fixed stratified subsample of the test data, the full test data being only used at the end of each epoch
+    - decide when to evaluate on a wall-clock interval instead of at the flags
+    - also measure the mean cost on the test data, for the early stopping monitoring the cost (see the stopping module)
+It is used through the "background_evaluation", "evaluation_sample", "evaluation_interval" and "monitor" arguments of Network.SGD
+"""
+
+import copy
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from network import is_array_data, data_length
+
+
+class EvaluationScheduler():
+
+    def __init__(self, net, test_data, background = False, sample_size = None, interval = None, with_cost = False):
+        if not is_array_data(test_data):
+            test_data = list(test_data)
+        self.net = net
+        self.test_data = test_data
+        self.sample = stratified_sample(test_data, sample_size) if sample_size and sample_size < data_length(test_data) else None
+        self.interval = interval
+        self.with_cost = with_cost
+        self.last_time = time.perf_counter()
+        self.executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self.pending = []
+
+    def due(self):
+        # Tells if the wall-clock interval has elapsed since the last evaluation
+        return self.interval is not None and time.perf_counter() - self.last_time >= self.interval
+
+    def submit(self, tag, full = False):
+        # Evaluates the current weights and biases, on the subsample unless "full" is set, the tag identifying the evaluation in the results
+        self.last_time = time.perf_counter()
+        data = self.test_data if full or self.sample is None else self.sample
+        snapshot = copy.copy(self.net)
+        snapshot.biases = [b.copy() for b in self.net.biases]
+        snapshot.weights = [w.copy() for w in self.net.weights]
+        if self.executor:
+            self.pending.append((tag, data, snapshot, self.executor.submit(score, snapshot, data, self.with_cost)))
+        else:
+            self.pending.append((tag, data, snapshot, score(snapshot, data, self.with_cost)))
+
+    def results(self, wait = False):
+        # Returns the finished evaluations as (tag, accuracy, n_examples, biases, weights, cost) tuples in their submission order, the mean cost being None unless with_cost is set
+        # The evaluations still running in the background are left for a later call, unless "wait" is set
+        finished = []
+        while self.pending:
+            tag, data, snapshot, scores = self.pending[0]
+            if self.executor:
+                if not (wait or scores.done()):
+                    break
+                scores = scores.result()
+            self.pending.pop(0)
+            correct, cost = scores
+            n = data_length(data)
+            finished.append((tag, 100 * correct / n, n, snapshot.biases, snapshot.weights, cost))
+        return finished
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+
+def score(net, data, with_cost = False):
+    # Returns the number of correctly classified examples, and the mean cost if with_cost is set (None otherwise)
+    return net.evaluate(data), (net.test_cost(data) if with_cost else None)
+
+
+def stratified_sample(test_data, sample_size, seed = 0):
+    # Draws a fixed subsample of about sample_size examples holding every expected digit in the same proportion as the whole test data
+    if is_array_data(test_data):
+        labels = test_data[1] if test_data[1].ndim == 1 else np.argmax(test_data[1], axis=1)
+    else:
+        labels = np.array([int(np.argmax(y)) if np.ndim(y) else int(y) for x,y in test_data])
+    rng = np.random.default_rng(seed)
+    indexes = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        count = max(1, int(round(sample_size * len(members) / len(labels))))
+        indexes.append(rng.choice(members, size=min(count, len(members)), replace=False))
+    indexes = np.sort(np.concatenate(indexes))
+    if is_array_data(test_data):
+        return (test_data[0][indexes], test_data[1][indexes])
+    return [test_data[k] for k in indexes]
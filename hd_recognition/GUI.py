@@ -13,15 +13,20 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 from PIL import ImageTk, Image
 from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel
-from PyQt5.QtGui import QPainter, QPixmap, QPen, QScreen
-import pickle
+from PyQt5.QtGui import QPainter, QPixmap, QPen, QImage
+from PyQt5.QtCore import Qt, QTimer
 import webbrowser
+import threading
+import time
 import os
 import sys
 sys.path.insert(1, str(os.getcwd()))
 
 # Neural network module
 import network
+import optimizers
+import reporting
+import registry
 
 
 
@@ -29,6 +34,9 @@ import network
 class Interface(tk.Frame):
     """graphic interface class"""
 
+    # Time between two readings of the training thread's messages, in milliseconds
+    TRAINING_POLL_INTERVAL = 100
+
 
 # ------------------------------------------------------------------------------__init__------------------------------------------------------------------------------------------------
 
@@ -41,6 +49,9 @@ class Interface(tk.Frame):
         self.font_title = tkFont.Font(family='Calibri', size=36, weight='bold')
         self.number_button_font = tkFont.Font(family='Calibri', size=25, weight='bold')
 
+        # Channel of the training running on its own thread (see start_training)
+        self.training_channel = None
+
         # Display main menu
         self.main_menu(window, **kwargs)
 
@@ -194,9 +205,7 @@ class Interface(tk.Frame):
             sizes.append(output_number)
             msg = msg + "Output layer : {} neurons\n\nActivation function : sigmoid (by default)".format(str(output_number))
             net = network.Network(model_name, sizes)
-            with open("models/hd_recognition/{}.pickle".format(model_name), "wb") as fic:
-                pickler = pickle.Pickler(fic)
-                pickler.dump(net)
+            net.save("models/hd_recognition/{}.model".format(model_name))
             messagebox.showinfo("Model Info", msg)
         else:
             messagebox.showerror("Error", "Error : missing required fields")
@@ -259,17 +268,43 @@ class Interface(tk.Frame):
         display_weights_cb = tk.Checkbutton(display_weights_frame, text="Dynamically display the weights of the first layer", font=self.medium_font_button, variable=self.display_weights_value)
         display_weights_cb.pack()
 
+        # Optimizer Frame (choosing an optimizer sets its usual learning rate)
+        optimizer_frame = tk.LabelFrame(training_custom_frame)
+        optimizer_frame.grid(row=1, column=0, pady=(30,0))
+        optimizer_label = tk.Label(optimizer_frame, text="Optimizer", font=self.medium_font_button)
+        optimizer_label.pack()
+        self.optimizer_name = tk.StringVar(value='sgd')
+        optimizer_menu = tk.OptionMenu(optimizer_frame, self.optimizer_name, *optimizers.OPTIMIZERS, command=self.optimizer_choice)
+        optimizer_menu.pack()
+
+        # Learning rate Frame
+        eta_frame = tk.LabelFrame(training_custom_frame)
+        eta_frame.grid(row=1, column=2, padx=70, pady=(30,0))
+        eta_label = tk.Label(eta_frame, text="learning rate (eta)", font=self.medium_font_button)
+        eta_label.pack()
+        self.eta_number = tk.Entry(eta_frame)
+        self.eta_number.insert(0,optimizers.DEFAULT_ETAS['sgd'])
+        self.eta_number.pack()
+
+    def optimizer_choice(self, optimizer_name):
+        """This method is executed when an optimizer is chosen. It sets the learning rate to the optimizer's usual one"""
+        self.eta_number.delete(0, tk.END)
+        self.eta_number.insert(0, optimizers.DEFAULT_ETAS[optimizer_name])
+
     def model_training(self, window, **kwargs):
         """Model training Frame"""
 
         # Training values retrieving
         disp_weights = bool(self.display_weights_value.get())
+        optimizer_name = self.optimizer_name.get()
         try:
             epochs = int(self.epochs_number.get())
             batch_size = int(self.batch_size_number.get())
+            eta = float(self.eta_number.get())
         except ValueError:
             messagebox.showerror("Error", "Error : please enter a numeric value for each field")
-        
+            return
+
         if epochs and batch_size:
             # Frame creation
             self.destroy()
@@ -282,12 +317,20 @@ class Interface(tk.Frame):
             btn_home.grid(column=0, row=0)
 
             # Training trigger button
-            doIt = tk.Button(self, text="Start the Training", command=lambda: self.start_training(epochs, batch_size, disp_weights), font=self.big_font_button)
-            doIt.grid(row=0, column=1, pady=20)
+            self.start_button = tk.Button(self, text="Start the Training", command=lambda: self.start_training(epochs, batch_size, disp_weights, optimizer_name, eta), font=self.big_font_button)
+            self.start_button.grid(row=0, column=1, pady=20)
+
+            # Training control buttons (enabled while the training runs)
+            controls_frame = tk.Frame(self, bg="#fff2f2")
+            controls_frame.grid(row=0, column=2, padx=(20,0))
+            self.pause_button = tk.Button(controls_frame, text="Pause", command=self.pause_training, font=self.medium_font_button, state=tk.DISABLED)
+            self.pause_button.pack(side=tk.LEFT, padx=5)
+            self.cancel_button = tk.Button(controls_frame, text="Cancel", command=self.cancel_training, font=self.medium_font_button, state=tk.DISABLED)
+            self.cancel_button.pack(side=tk.LEFT, padx=5)
 
             # Training logs textbox
             textbox_frame = tk.LabelFrame(self)
-            textbox_frame.grid(row=1, column=0, columnspan=2)
+            textbox_frame.grid(row=1, column=0, columnspan=3)
             self.output = tk.Text(textbox_frame, width=110, height=30, bg='black', fg='white')
             self.output.pack(side=tk.LEFT)
 
@@ -300,44 +343,89 @@ class Interface(tk.Frame):
         else:
             messagebox.showerror("Error", "Error : missing required fields")
 
-    def start_training(self, epochs, batch_size, disp_weights):
-        """This method executes the SGD training method on a given model"""
-        # Importing the mnist dataset
-        import mnist_loader
-        training_data, validation_data, test_data = mnist_loader.load_data_wrapper()
-        training_data = list(training_data)
-        validation_data = list(validation_data)
-        test_data = list(test_data)
-
-        # Model training via SGD
+    def start_training(self, epochs, batch_size, disp_weights, optimizer_name = 'sgd', eta = 3):
+        """This method starts the SGD training of the model on its own thread : the window stays responsive, and the training's messages are read by the Tk event loop"""
+        if self.training_channel and not self.training_channel.finished.is_set():
+            messagebox.showerror("Error", "Error : a training is already running")
+            return
         net = self.model_file
         self.output.insert(tk.END, "\n" + str(net) + "\n")
-        self.update_idletasks()
-        net.SGD(training_data, epochs, batch_size, test_data=test_data, display_weights=disp_weights, gui=self)
-
-        # Model saving
-        with open("models/hd_recognition/{}.pickle".format(net.id), "wb") as saving:
-            saver = pickle.Pickler(saving)
-            saver.dump(net)
-
-        # Performance test of the network on the validation data
-        accuracy = str(100 * net.evaluate(validation_data) / 10000)
-        self.output.insert(tk.END, "\nTest on the validation data -> Accuracy : {0}%\n".format(accuracy))
-        self.update_idletasks()
+        self.training_channel = reporting.TrainingChannel()
+        self.start_button.config(state=tk.DISABLED)
+        self.pause_button.config(state=tk.NORMAL, text="Pause")
+        self.cancel_button.config(state=tk.NORMAL)
+        training_thread = threading.Thread(target=self.training_worker, args=(net, self.training_channel, epochs, batch_size, disp_weights, optimizer_name, eta), daemon=True)
+        training_thread.start()
+        # The polling is scheduled on the window rather than on this frame, whose callbacks are deleted when it is destroyed (when another menu is opened)
+        self.master.after(self.TRAINING_POLL_INTERVAL, self.poll_training, self.training_channel)
+
+    def training_worker(self, net, channel, epochs, batch_size, disp_weights, optimizer_name, eta):
+        """This method runs on the training thread : it never touches the widgets, its messages go through the channel"""
+        try:
+            # Importing the mnist dataset
+            import mnist_loader
+            training_data, validation_data, test_data = mnist_loader.load_data()
+
+            # Model training via SGD
+            # The plain gradient descent is SGD's own update rule
+            optimizer = None if optimizer_name == 'sgd' else optimizer_name
+            start_time = time.perf_counter()
+            net.SGD(training_data, epochs, batch_size, eta=eta, test_data=test_data, display_weights=disp_weights, reporter=channel, optimizer=optimizer)
+            training_time = time.perf_counter() - start_time
+            if channel.cancelled.is_set():
+                channel.report("\nThe cancelled training's model is not saved\n")
+                return
+
+            # Model saving
+            model_path = "models/hd_recognition/{}.model".format(net.id)
+            net.save(model_path)
+
+            # Performance test of the network on the validation data
+            accuracy = 100 * net.evaluate(validation_data) / 10000
+            channel.report("\nTest on the validation data -> Accuracy : {0}%\n".format(accuracy))
+
+            # Registration of the model (the registry's connection belongs to this thread)
+            with registry.ModelRegistry(registry.HD_REGISTRY) as models:
+                models.register(net, accuracy, model_path, training_time, {'epochs': epochs, 'mini_batch_size': batch_size, 'eta': eta, 'optimizer': optimizer_name})
+        except Exception as error:
+            channel.report("\nError : the training failed ({})\n".format(error))
+        finally:
+            channel.finish()
+
+    def poll_training(self, channel):
+        """This method is executed by the Tk event loop while a training runs : it writes the messages waiting in the channel"""
+        messages = channel.drain()
+        # The training frame may have been left during the training
+        if messages and self.output.winfo_exists():
+            self.output.insert(tk.END, "".join(messages))
+            self.output.see("end")
+        if not channel.done():
+            self.master.after(self.TRAINING_POLL_INTERVAL, self.poll_training, channel)
+        elif self.start_button.winfo_exists():
+            if channel.dropped:
+                self.output.insert(tk.END, "\n({} training messages were dropped)\n".format(channel.dropped))
+                self.output.see("end")
+            self.start_button.config(state=tk.NORMAL)
+            self.pause_button.config(state=tk.DISABLED, text="Pause")
+            self.cancel_button.config(state=tk.DISABLED)
+
+    def pause_training(self):
+        """This method is executed when the pause button is pressed. It pauses or resumes the training between two mini-batches"""
+        if self.training_channel.paused():
+            self.training_channel.resume()
+            self.pause_button.config(text="Pause")
+            self.output.insert(tk.END, "\nTraining resumed\n")
+        else:
+            self.training_channel.pause()
+            self.pause_button.config(text="Resume")
+            self.output.insert(tk.END, "\nTraining paused\n")
         self.output.see("end")
 
-        # Ladder update
-        with open("models/hd_recognition/accuracy_ladder.md", "a") as ladder:
-            adding = str(net) + " --> accuracy = " + accuracy + "\n"
-            ladder.write(adding)
-        with open("models/hd_recognition/accuracy_ladder.md", "r") as ladder:
-            shove_percent = ladder.read().replace("%", "")
-            content = [net.split("= ") for net in shove_percent.split('\n')]
-            content.pop()
-            content_updated = sorted([(acc,net) for net,acc in content], reverse = True)
-            tostring = "%\n".join(["= ".join((net,acc)) for acc,net in content_updated]) + "%\n"
-        with open("models/hd_recognition/accuracy_ladder.md", "w") as ladder:
-            ladder.write(tostring)
+    def cancel_training(self):
+        """This method is executed when the cancel button is pressed. The training stops after its current mini-batch"""
+        self.training_channel.cancel()
+        self.pause_button.config(state=tk.DISABLED, text="Pause")
+        self.cancel_button.config(state=tk.DISABLED)
 
 
 # ------------------------------------------------------------------------------Models Ladder Interface------------------------------------------------------------------------------------
@@ -363,11 +451,11 @@ class Interface(tk.Frame):
         textbox_frame.grid(row=1, column=0, columnspan=2)
         output = tk.Text(textbox_frame, width=100, height=20, font=self.medium_font_button)
         output.pack(side=tk.LEFT)
-        with open("models/hd_recognition/accuracy_ladder.md", "r") as ladder:
-            content = ladder.read()
+        # The registry lists the best models first
+        with registry.ModelRegistry(registry.HD_REGISTRY) as models:
+            content = models.ladder()
         output.insert(tk.END, content)
         self.update_idletasks()
-        output.see("end")
 
         # Scrollbar
         scrollbar = tk.Scrollbar(textbox_frame, orient="vertical", command = output.yview)
@@ -508,6 +596,9 @@ class Interface(tk.Frame):
         live_prediction_starting_button = tk.Button(live_prediction_starting_frame, text="Start", font=self.medium_large_font_button, command=lambda: self.start_live_prediction(window))
         live_prediction_starting_button.pack()
 
+        # The activations plot is created at the first prediction
+        self.live_plot = None
+
     def start_live_prediction(self, window):
         """Live prediction Qt drawing window display"""
         # DrawingWindow creation
@@ -526,14 +617,12 @@ class Interface(tk.Frame):
         while re:
             try:
                 # Model file opening prompt
-                self.model_filename = filedialog.askopenfilename(initialdir="models/hd_recognition", title="Choose the model", filetypes=(("pickle files","*.pickle"), ("model files","*.model"), ("all files", "*.*")))
+                self.model_filename = filedialog.askopenfilename(initialdir="models/hd_recognition", title="Choose the model", filetypes=(("model files","*.model"), ("pickle files","*.pickle"), ("all files", "*.*")))
                 assert self.model_filename
                 re = False
             except:
                 messagebox.showerror("Error", "Error : please select a model file")
-        with open(self.model_filename, "rb") as fic:
-            unpickler = pickle.Unpickler(fic)
-            self.model_file = unpickler.load()
+        self.model_file = network.Network.load(self.model_filename)
 
     def plot_model_activation(self, model_activations, frame):
         """Plots the current model activations in a given frame (in a prediction context)"""
@@ -553,6 +642,30 @@ class Interface(tk.Frame):
         canvas.get_tk_widget().grid(row=0, column=1)
         self.annot_max(range(10), model_activations, axes)
 
+    def update_live_activation(self, model_activations):
+        """Updates the live prediction plot in place : the figure is created at the first prediction, then only its curve and annotation change"""
+        if self.live_plot is None:
+            prediction_frame = tk.LabelFrame(self)
+            prediction_frame.grid(row=2,column=2)
+            fig = Figure(figsize = (4, 4))
+            axes = fig.add_subplot(111)
+            line, = axes.plot(range(10), model_activations)
+            fig.suptitle("corresponding model activations")
+            axes.set_xlabel("digit")
+            axes.set_ylabel("activation")
+            axes.set_ylim([0, 1])
+            axes.set_xticks(range(10))
+            axes.set_yticks(np.array(range(11))/10)
+            canvas = FigureCanvasTkAgg(fig, master=prediction_frame)
+            canvas.get_tk_widget().grid(row=0, column=1)
+            self.live_plot = {'frame': prediction_frame, 'canvas': canvas, 'axes': axes, 'line': line}
+        else:
+            self.live_plot['line'].set_ydata(model_activations)
+            self.live_plot['axes'].texts[-1].remove()
+        self.annot_max(range(10), model_activations, self.live_plot['axes'])
+        self.live_plot['canvas'].draw()
+        self.live_plot['canvas'].flush_events()
+
     def annot_max(x, y, ax):
         """Max network activation anotation for a number image"""
         xmax = x[np.argmax(y)]
@@ -578,6 +691,9 @@ class DrawingWindow(QMainWindow):
 
     """Drawing window for live model prediction"""
 
+    # Shortest time between two predictions while drawing, in milliseconds
+    PREDICTION_INTERVAL = 50
+
     def __init__(self, App, tkinter_root):
         """Initialization of the Drawing Window : we create a label centered in the window, in which we put a blank pixmap"""
         super().__init__()
@@ -589,6 +705,15 @@ class DrawingWindow(QMainWindow):
 
         self.last_x, self.last_y = None, None
 
+        # The drawing is rasterized into this network input buffer, reused at each prediction
+        self.image_array = np.zeros((784,1), dtype=self.tkinter_root.model_file.dtype)
+
+        # The predictions are rate-limited : a mouse move starts the timer if it is not already running, and the drawing is predicted when it times out
+        self.prediction_timer = QTimer()
+        self.prediction_timer.setSingleShot(True)
+        self.prediction_timer.setInterval(self.PREDICTION_INTERVAL)
+        self.prediction_timer.timeout.connect(self.predict)
+
     def blank(self):
         """This method clears the QtWindow, setting the content of the centered label to a white pixmap"""
         self.label.setPixmap(QPixmap("hd_recognition/assets/white.png"))
@@ -609,39 +734,42 @@ class DrawingWindow(QMainWindow):
         self.last_x = e.x()
         self.last_y = e.y()
 
-        # Saving the screenshot and compressing it to a 28x28 image
-        QScreen.grabWindow(self.App.primaryScreen(), self.winId()).save("hd_recognition/tmp/screenshot.png", 'png')
-        resize_img = Image.open("hd_recognition/tmp/screenshot.png")
-        resize_img = resize_img.resize((28,28))
-        resize_img.save("hd_recognition/tmp/screenshot.png", 'png')
-        
-        # Converting from standard png to greyscale 
-        img_array = np.array(Image.open("hd_recognition/tmp/screenshot.png"))
-        img_array = np.array([[pixel[0] for pixel in line] for line in img_array])
-        image_array = 1 - (img_array.reshape(784,1) / 255)
+        if not self.prediction_timer.isActive():
+            self.prediction_timer.start()
 
-        # Predicting the number 
-        model_activations = self.tkinter_root.model_file.feedforward(image_array)
+    def predict(self):
+        """Predicts the drawn number and updates the activations plot"""
+        # The pixmap is downsampled in memory to a 28x28 greyscale image, whose rows are padded to bytesPerLine bytes
+        image = self.label.pixmap().toImage().scaled(28, 28, Qt.IgnoreAspectRatio, Qt.SmoothTransformation).convertToFormat(QImage.Format_Grayscale8)
+        pixels = np.frombuffer(image.constBits().asstring(image.bytesPerLine() * 28), dtype=np.uint8).reshape(28, image.bytesPerLine())[:, :28]
 
-        # Prediction plot frame
-        prediction_frame = tk.LabelFrame(self.tkinter_root)
-        prediction_frame.grid(row=2,column=2)
+        # Converting the greyscale values (white background) to network inputs (0 for the background)
+        np.multiply(pixels.reshape(784,1), -1 / 255, out=self.image_array)
+        self.image_array += 1
+
+        # Predicting the number 
+        model_activations = self.tkinter_root.model_file.feedforward(self.image_array)
 
         # Plotting the model activations
-        self.tkinter_root.plot_model_activation(model_activations, prediction_frame)
+        self.tkinter_root.update_live_activation(model_activations)
 
     def mouseReleaseEvent(self, e):
         self.last_x = None
         self.last_y = None
+        # The end of the stroke is always predicted
+        self.prediction_timer.stop()
+        self.predict()
 
 
 
 # -----------------------------------------------------------------------------Tkinter Window creation-------------------------------------------------------------------------------------
 
-window = tk.Tk()
-window.geometry("1180x620")
-window.title("Neural Networks")
-window.configure(bg="#fff2f2")
-interface = Interface(window)
-interface.mainloop()
+#The window is only created when the GUI is run, not when the weights renderer's process (spawned during the trainings) imports this script again
+if __name__ == '__main__':
+    window = tk.Tk()
+    window.geometry("1180x620")
+    window.title("Neural Networks")
+    window.configure(bg="#fff2f2")
+    interface = Interface(window)
+    interface.mainloop()
 
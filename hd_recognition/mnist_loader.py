@@ -12,12 +12,16 @@ function usually called by our neural network code.
 
 #### Libraries
 # Standard library
+import os
 import pickle
 import gzip
 
 # Third-party libraries
 import numpy as np
 
+DATA_DIRECTORY = 'hd_recognition/mnist_data'
+DATA_SETS = ('training', 'validation', 'test')
+
 def load_data():
     """Return the MNIST data as a tuple containing the training data,
     the validation data, and the test data.
@@ -36,13 +40,53 @@ def load_data():
     helpful to modify the format of the ``training_data`` a little.
     That's done in the wrapper function ``load_data_wrapper()``, see
     below.
+    If the data has been converted to ``.npy`` arrays by
+    ``convert_data()``, the arrays are memory-mapped instead of
+    decoding ``mnist.pkl.gz``.
     """
-    f = gzip.open('hd_recognition/mnist_data/mnist.pkl.gz', 'rb')
+    if arrays_exist():
+        return load_data_arrays()
+    return load_pickled_data()
+
+def load_pickled_data():
+    """Return the MNIST data exactly like ``load_data``, always
+    decoding it from ``mnist.pkl.gz``."""
+    f = gzip.open(os.path.join(DATA_DIRECTORY, 'mnist.pkl.gz'), 'rb')
     training_data, validation_data, test_data = pickle.load(f, encoding="latin1")
     f.close()
     return (training_data, validation_data, test_data)
 
-def load_data_wrapper():
+def convert_data(directory=None):
+    """Decode ``mnist.pkl.gz`` once and write each data set into two
+    contiguous ``.npy`` files in ``directory``: ``<set>_inputs.npy``, a
+    float32 array of shape (N, 784), and ``<set>_labels.npy``, an int64
+    array of shape (N,), where ``<set>`` is ``training``, ``validation``
+    or ``test`` (``directory`` defaults to ``DATA_DIRECTORY``)."""
+    directory = directory or DATA_DIRECTORY
+    for name, (inputs, labels) in zip(DATA_SETS, load_pickled_data()):
+        np.save(os.path.join(directory, name + '_inputs.npy'), np.ascontiguousarray(inputs, dtype=np.float32))
+        np.save(os.path.join(directory, name + '_labels.npy'), np.ascontiguousarray(labels, dtype=np.int64))
+
+def arrays_exist(directory=None):
+    """Return whether ``convert_data`` has written the ``.npy`` arrays
+    in ``directory``."""
+    directory = directory or DATA_DIRECTORY
+    return all(os.path.exists(os.path.join(directory, name + suffix))
+               for name in DATA_SETS for suffix in ('_inputs.npy', '_labels.npy'))
+
+def load_data_arrays(directory=None, mmap_mode='r'):
+    """Return the ``(training_data, validation_data, test_data)``
+    written by ``convert_data``, each one an ``(inputs, labels)`` tuple
+    of an (N, 784) array and an (N,) array of digit values.
+    The arrays are memory-mapped with ``mmap_mode`` ('r' by default,
+    None loads them in memory): nothing is read from the disk until
+    the examples are actually used, and the arrays are read-only."""
+    directory = directory or DATA_DIRECTORY
+    return tuple((np.load(os.path.join(directory, name + '_inputs.npy'), mmap_mode=mmap_mode),
+                  np.load(os.path.join(directory, name + '_labels.npy'), mmap_mode=mmap_mode))
+                 for name in DATA_SETS)
+
+def load_data_wrapper(dtype=np.float64):
     """Return a tuple containing ``(training_data, validation_data,
     test_data)``. Based on ``load_data``, but the format is more
     convenient for use in our implementation of neural networks.
@@ -59,22 +103,28 @@ def load_data_wrapper():
     Obviously, this means we're using slightly different formats for
     the training data and the validation / test data.  These formats
     turn out to be the most convenient for use in our neural network
-    code."""
+    code.
+    The inputs and the unit vectors are numpy arrays of type ``dtype``
+    (float64 by default), which should match the ``dtype`` of the
+    network they are fed to."""
     tr_d, va_d, te_d = load_data()
-    training_inputs = [np.reshape(x, (784, 1)) for x in tr_d[0]]
-    training_results = [vectorized_result(y) for y in tr_d[1]]
+    training_inputs = [np.reshape(x, (784, 1)).astype(dtype) for x in tr_d[0]]
+    training_results = [vectorized_result(y, dtype) for y in tr_d[1]]
     training_data = zip(training_inputs, training_results)
-    validation_inputs = [np.reshape(x, (784, 1)) for x in va_d[0]]
+    validation_inputs = [np.reshape(x, (784, 1)).astype(dtype) for x in va_d[0]]
     validation_data = zip(validation_inputs, va_d[1])
-    test_inputs = [np.reshape(x, (784, 1)) for x in te_d[0]]
+    test_inputs = [np.reshape(x, (784, 1)).astype(dtype) for x in te_d[0]]
     test_data = zip(test_inputs, te_d[1])
     return (training_data, validation_data, test_data)
 
-def vectorized_result(j):
+def vectorized_result(j, dtype=np.float64):
     """Return a 10-dimensional unit vector with a 1.0 in the jth
     position and zeroes elsewhere.  This is used to convert a digit
     (0...9) into a corresponding desired output from the neural
     network."""
-    e = np.zeros((10, 1))
+    e = np.zeros((10, 1), dtype=dtype)
     e[j] = 1.0
     return e
+
+if __name__ == '__main__':
+    convert_data()
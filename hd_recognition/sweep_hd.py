@@ -0,0 +1,39 @@
+# -*- coding:utf-8 -*-
+
+"""
+This is an usage example of the "sweep" module. In this example, we look for the best hyper-parameters to recognize 28x28 pixels images of handwritten digits
+Every configuration of the grid is trained in parallel on the mnist training data, and only the best ones on the validation data keep training
+"""
+
+#get access to the root of the project
+import os
+import sys
+sys.path.insert(1, str(os.getcwd()))
+
+import mnist_loader
+import registry
+import sweep
+
+#Each hyper-parameter takes all the values of its list (the missing ones keep their default values : see sweep.SWEEP_DEFAULTS)
+grid = {
+    'sizes': [[784, 16, 10], [784, 36, 10], [784, 36, 36, 10]],
+    'activation_function_name': ['sigmoid', 'tanh'],
+    'eta': [0.5, 3],
+    'mini_batch_size': [10, 30],
+}
+
+if __name__ == '__main__':
+    #The sweep only uses the training and validation data : the test data stays unseen to compare the chosen model with the others
+    training_data, validation_data, test_data = mnist_loader.load_data()
+
+    #The configurations first train for a quarter of an epoch, then the best half of them train twice longer, and so on until 4 epochs
+    #Every result is registered in the models registry ("python registry.py --order-by training_time" lists them)
+    trials = sweep.successive_halving(training_data, validation_data, grid, min_epochs=0.25, max_epochs=4, reduction=2, registry=registry.HD_REGISTRY)
+    best = trials[0]
+    print("\nBest configuration : {}\nValidation accuracy : {:.2f}%".format(sweep.describe(best['config']), best['accuracy']))
+
+    #The best model is saved in the models folder
+    net = best['net']
+    net.id = "sweep_best"
+    net.save("models/hd_recognition/{}.model".format(net.id))
+    print("Test on the test data -> Accuracy : {0}%\n".format(100 * net.evaluate(test_data) / 10000))
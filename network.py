@@ -1,305 +1,697 @@
 
 # -*- coding:utf-8 -*-
 
-import tkinter as tk
+# The numerical core only needs numpy : the plots (see the plotting module), the weights rendering and the GUI are loaded lazily, when they are used
 import numpy as np
-import random
-from matplotlib import pyplot as plt
-plt.ion()
-from PIL import Image
-import matplotlib.image as mpimg
-from math import sqrt, ceil
-import warnings
-np.seterr(all='warn')
+from math import ceil
+import json
+import pickle
+from profiling import Profiler, NULL_PROFILER
+from reporting import report
+# Underflows to zero (in the exponentials of the sigmoid and the softmax) are harmless : warning about them would slow down every forward pass
+np.seterr(all='warn', under='ignore')
+
+#activation functions, with their derivatives expressed from the activation function's output a = f(z) so that backprop can reuse the outputs of the forward pass
+#each one can write its result into a preallocated "out" array (which can be its own input)
+def sigmoid(z, out = None):
+    out = np.negative(z, out=out)
+    np.exp(out, out=out)
+    out += 1
+    return np.reciprocal(out, out=out)
+
+def sigmoid_derivative(a, out = None):
+    out = np.subtract(1, a, out=out)
+    out *= a
+    return out
+
+def relu(z, out = None):
+    return np.maximum(z, 0, out=out)
+
+def relu_derivative(a, out = None):
+    if out is None:
+        out = np.empty_like(a)
+    return np.greater(a, 0, out=out)
+
+def tanh(z, out = None):
+    return np.tanh(z, out=out)
+
+def tanh_derivative(a, out = None):
+    out = np.multiply(a, a, out=out)
+    return np.subtract(1, out, out=out)
+
+ACTIVATION_FUNCTIONS = {
+    'sigmoid': (sigmoid, sigmoid_derivative),
+    'relu': (relu, relu_derivative),
+    'tanh': (tanh, tanh_derivative),
+}
+
+#output regulation functions, applied column by column to the last layer's activations
+#the exponentials of the softmax are computed from the activations minus their maximum (which doesn't change the result) so that they never overflow
+def softmax(x, out = None):
+    out = np.subtract(x, np.max(x, axis=0, keepdims=True), out=out)
+    np.exp(out, out=out)
+    out /= np.sum(out, axis=0, keepdims=True)
+    return out
+
+def log_softmax(x, out = None):
+    out = np.subtract(x, np.max(x, axis=0, keepdims=True), out=out)
+    out -= np.log(np.sum(np.exp(out), axis=0, keepdims=True))
+    return out
+
+#cost functions : the cross-entropy needs outputs which are probabilities, given by a softmax regulation or by sigmoid activations without regulation
+COST_FUNCTIONS = ('quadratic', 'cross_entropy')
+
+#layouts of the inputs of feedforward_batch : one input per column (shape (784, n), like feedforward) or one input per row (shape (n, 784), like the array data-sets)
+BATCH_LAYOUTS = ('columns', 'rows')
 
 class Network():
 
-    def __init__(self, id, sizes, activation_function_name = 'sigmoid', regu_name=None):
+    def __init__(self, id, sizes, activation_function_name = 'sigmoid', regu_name=None, dtype = np.float64, cost_name = 'quadratic'):
+        if cost_name not in COST_FUNCTIONS:
+            raise ValueError("unknown cost function '{}', expected one of {}".format(cost_name, COST_FUNCTIONS))
+        if cost_name == 'cross_entropy' and regu_name != 'softmax' and (regu_name or activation_function_name != 'sigmoid'):
+            raise ValueError("the cross-entropy cost needs a softmax output regulation, or sigmoid activations without regulation")
         self.id = str(id)
         self.sizes = sizes
         self.num_layers = len(sizes)
-        self.biases = [np.random.randn(y,1) for y in sizes[1:]]
-        self.weights = [np.random.randn(y,x) for x,y in zip(sizes[:-1],sizes[1:])]
+        self.dtype = np.dtype(dtype)
+        self.biases = [np.random.randn(y,1).astype(self.dtype) for y in sizes[1:]]
+        self.weights = [np.random.randn(y,x).astype(self.dtype) for x,y in zip(sizes[:-1],sizes[1:])]
         self.activation_function_name = activation_function_name
         self.regu_name = regu_name
+        self.cost_name = cost_name
+
+    def __setstate__(self, state):
+        # Models pickled before the dtype and cost options existed get the dtype of their weights and the quadratic cost
+        self.__dict__.update(state)
+        if 'dtype' not in state:
+            self.dtype = self.weights[0].dtype
+        if 'cost_name' not in state:
+            self.cost_name = 'quadratic'
 
     def feedforward(self, x):
-        for w,b in zip(self.weights, self.biases):
-            x = self.regu(self.activation_function(np.dot(w, x) + b)) 
-        return x
+        # The output regulation only applies to the last layer, like in backprop
+        # w.dot is the product of the dense layers and of the sparse ones (the pruned layers stored as CSR matrixes, see the pruning module)
+        x = np.asarray(x, dtype=self.dtype)
+        softmax_output = self.softmax_output()
+        for k,(w,b) in enumerate(zip(self.weights, self.biases)):
+            x = w.dot(x)
+            x += b
+            if not (softmax_output and k == self.num_layers - 2):
+                x = self.activation_function(x, out=x)
+        return self.regu(x, out=x)
+
+    def feedforward_batch(self, X, layout = 'columns'):
+        # X holds one input per column (layout 'columns', shape (784, n)) or one input per row (layout 'rows', shape (n, 784)), the outputs are returned with the same layout
+        if layout not in BATCH_LAYOUTS:
+            raise ValueError("unknown batch layout '{}', expected one of {}".format(layout, BATCH_LAYOUTS))
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[0 if layout == 'columns' else 1] != self.sizes[0]:
+            raise ValueError("a batch of inputs with one input per {} must have {} {}, got the shape {}".format(layout[:-1], self.sizes[0], 'rows' if layout == 'columns' else 'columns', X.shape))
+        if layout == 'columns':
+            return self.feedforward(X)
+        return self.feedforward(X.T).T
 
-    def SGD(self, training_data, epochs, mini_batch_size, eta = 3, min_eta = 2, test_data = None, verbose = True, flags_per_epoch = 5, display_weights = False, dropout_value = None, gui=None, optimize_accuracy=False):
+    def SGD(self, training_data, epochs, mini_batch_size, eta = 3, min_eta = 2, test_data = None, verbose = True, flags_per_epoch = 5, display_weights = False, dropout_value = None, gui=None, optimize_accuracy=False, epoch_size = None, processes = None, parallel_mode = 'sync', profile = False, profile_memory = False, background_evaluation = False, evaluation_sample = None, evaluation_interval = None, keep_best = 1, checkpoint_directory = None, ema_decay = None, optimizer = None, patience = None, target_accuracy = None, max_time = None, max_samples = None, monitor = 'accuracy', reporter = None, masks = None):
+        # training_data is a list of (x, y) tuples, an (inputs, outputs) tuple of arrays holding one example per row (the outputs being one-hot rows or digit labels),
+        # or a stream of (x, y) tuples read again at each epoch : a re-iterable object, or a function returning a new iterable (a generator function for instance)
+        # The number of training examples per epoch "epoch_size" is only needed for streams without a length
+        # With a number of worker "processes", the mini-batches are computed by a pool of processes sharing the weights and biases (see the parallel module)
+        # The test data is evaluated at each flag, or every "evaluation_interval" seconds : on a background thread with "background_evaluation", and on a stratified subsample of "evaluation_sample" examples (the whole test data being evaluated at the end of each epoch)
+        # With "optimize_accuracy", the best state evaluated on the whole test data is restored at the end of the training : the "keep_best" best states are kept in memory, or in the "checkpoint_directory" (see the checkpoints module)
+        # With "ema_decay", an exponential moving average of the weights and biases is kept along the training : it is the final model, unless optimize_accuracy finds a better state
+        # The "optimizer" ('momentum', 'nesterov', 'rmsprop', 'adam' or an optimizer instance, see the optimizers module) replaces the plain gradient descent update, eta being its learning rate
+        # The training stops early after "patience" evaluations on the whole test data without improvement of the "monitor"ed metric ('accuracy' or 'cost'), once "target_accuracy" is reached,
+        # or after "max_time" seconds or "max_samples" training examples (see the stopping module) : the best state is then restored if there is test data, and the reason of the stop is returned
+        # The messages of the training are printed, or written in the "gui"'s output widget, or handed to the report method of a "reporter" : a reporting.TrainingChannel lets another thread (a GUI) receive them, and pause or cancel the training
+        # With "masks" (a boolean array or None for each layer), the weights out of their layer's mask are kept at zero, the masks being applied after each update (see the pruning module)
+        # With "profile", the time spent in each phase of the training (and its peak memory with "profile_memory") is reported, and exported as a Chrome trace in the training's folder
         flags_per_epoch = int(flags_per_epoch)
-        len_mini_batches = int(len(training_data) / mini_batch_size)
+        output = reporter if reporter is not None else gui
+        if not is_array_data(training_data) and not callable(training_data) and not hasattr(training_data, '__len__') and iter(training_data) is training_data:
+            training_data = list(training_data)
+        if epoch_size is None:
+            if not hasattr(training_data, '__len__'):
+                raise ValueError("the epoch_size must be given to train on a stream of training examples")
+            epoch_size = data_length(training_data)
+        if masks is not None and processes and parallel_mode != 'sync':
+            raise ValueError("the masks can't be applied to the weights updated by the workers of the '{}' parallel mode".format(parallel_mode))
+        # The pruned layers stored as sparse matrixes are trained as dense arrays
+        self.densify()
+        stopper = None
+        if patience is not None or target_accuracy is not None or max_time is not None or max_samples is not None:
+            from stopping import EarlyStopping
+            stopper = EarlyStopping(patience, target_accuracy, max_time, max_samples, monitor)
+            if stopper.needs_evaluations() and not test_data:
+                raise ValueError("the patience and target_accuracy stopping criteria need test data")
+        n = epoch_size
+        len_mini_batches = int(n / mini_batch_size)
         fpe = range(0, len_mini_batches + 1, int(len_mini_batches / flags_per_epoch))
         fpe = [fp for fp in fpe]
         fpe.remove(0)
-        training_data = list(training_data)
-        n = len(training_data)        
+        n_mini_batches = ceil(n / mini_batch_size)
         txt = "\nBeginning of the standard SGD method.\nThe network will be trained with :\n- {0} epochs\n- a mini-batch size of {1}\n- a starting learning rate of eta = {2} (min_eta = {3})\n- {4} flags per epoch".format(epochs, mini_batch_size, eta, min_eta, flags_per_epoch)
-        if gui:
-            gui.output.insert(tk.END, txt)
-            gui.update_idletasks()
-        else:
-            print(txt)
+        report(txt, output)
+        if optimizer:
+            from optimizers import make_optimizer
+            optimizer = make_optimizer(optimizer, self)
+            txt = "\n- the {} optimizer".format(type(optimizer).__name__)
+            report(txt, output)
         if dropout_value:
             txt = "\n- a dropout value of {}%\n".format(dropout_value * 100)
-            if gui:
-                gui.output.insert(tk.END, txt)
-                gui.update_idletasks()
-            else:
-                print(txt)
-        if test_data or display_weights:
+            report(txt, output)
+        profiler = Profiler(profile_memory) if profile or profile_memory else NULL_PROFILER
+        if test_data or display_weights or profiler:
             import os
             dirs= next(os.walk("trainings"))[1]
             training_num = len(dirs) + 1
             os.mkdir("trainings/training_{}".format(str(training_num)))
         if test_data:
-            test_data = list(test_data)
-            n_test = len(test_data)
+            if not is_array_data(test_data):
+                test_data = list(test_data)
+            n_test = data_length(test_data)
+            from evaluation import EvaluationScheduler
+            scheduler = EvaluationScheduler(self, test_data, background_evaluation, evaluation_sample, evaluation_interval, with_cost = stopper is not None and monitor == 'cost')
             accuracy = 100 * self.evaluate(test_data) / n_test
             accuracies = []
             accuracies.append(accuracy)
             txt = "\n\nAccuracy of the model before training : {}%\n".format(accuracy)
-            if gui:
-                gui.output.insert(tk.END, txt)
-                gui.update_idletasks()
-            else:
-                print(txt)
+            report(txt, output)
         if display_weights:
             txt = "\n\nThe first layer's weights live training will be displayed on a matplotlib figure\n"
-            if gui:
-                gui.output.insert(tk.END, txt)
-                gui.update_idletasks()
-            else:
-                print(txt)
+            report(txt, output)
             os.mkdir("trainings/training_{}/weight_plots".format(str(training_num)))
-            file_count = 0
-            fig_size = ceil(sqrt(len(self.weights[0])))
-            fig = plt.figure("Weights live training", figsize = (fig_size, fig_size))
-            fig.suptitle("Weights live training (first hidden layer)", fontsize=16)
-            self.update_plot_weights(fig, fig_size, training_num, file_count)
-            plt.show()
-        states = list()
+            from rendering import WeightRenderer
+            renderer = WeightRenderer("trainings/training_{}/weight_plots".format(str(training_num)))
+            renderer.add(self.weights[0])
         current_eta = eta
-        for i in range(epochs):
-            fpe_index = 0
-            random.shuffle(training_data)
-            mini_batches = [training_data[k:k+mini_batch_size] for k in range(0,n,mini_batch_size)]
-            for f,mini_batch in enumerate(mini_batches):
-                self.update_mini_batch(mini_batch, current_eta, dropout_value)
-                if (f + 1) % fpe[fpe_index] == 0:
-                    message = "\nEpoch {0}/{1} : [mini-batch {2} / {3}]".format(i + 1, str(epochs), str(f + 1), str(len(mini_batches)))
-                    if fpe_index != len(fpe) - 1:
-                        fpe_index += 1
+        keeper = None
+        # The best state is restored at the end of the training with optimize_accuracy, and when it is stopped early
+        restore_best = test_data and (optimize_accuracy or stopper is not None)
+        if restore_best or ema_decay is not None:
+            from checkpoints import CheckpointKeeper
+            keeper = CheckpointKeeper(self, keep_best, checkpoint_directory, ema_decay)
+        workspace = Workspace(self.sizes, self.dtype)
+        trainer = None
+        stop_reason = None
+        # The workers, the evaluation thread and the weights renderer are stopped (and the shared memory of the workers released) even when the training fails
+        try:
+            if processes:
+                from parallel import ParallelTrainer
+                trainer = ParallelTrainer(self, training_data, processes, parallel_mode, dropout_value, optimizer)
+            if stopper:
+                stopper.start()
+            for i in range(epochs):
+                fpe_index = 0
+                if trainer:
+                    mini_batches = mini_batch_indexes(n, mini_batch_size)
+                else:
+                    mini_batches = self.mini_batches(training_data, mini_batch_size, workspace)
+                for f,mini_batch in enumerate(profiler.timed(mini_batches, 'gather')):
+                    if trainer:
+                        with profiler.phase('parallel_step'):
+                            trainer.step(mini_batch, current_eta)
+                    else:
+                        self.update_stacked_mini_batch(mini_batch[0], mini_batch[1], current_eta, dropout_value, workspace, profiler, optimizer)
+                    if masks is not None:
+                        with profiler.phase('masks'):
+                            for w, mask in zip(self.weights, masks):
+                                if mask is not None:
+                                    w *= mask
+                    if ema_decay is not None:
+                        with profiler.phase('ema'):
+                            keeper.update_ema(self.biases, self.weights)
+                    if stopper:
+                        stop_reason = stopper.budget_reason(len(mini_batch) if trainer else mini_batch[0].shape[1])
+                    if stop_reason is None and hasattr(reporter, 'stop_reason'):
+                        stop_reason = reporter.stop_reason()
+                    at_flag = (f + 1) % fpe[fpe_index] == 0
+                    # A spent budget ends the training like the end of an epoch, with an evaluation on the whole test data
+                    last = f + 1 == n_mini_batches or stop_reason is not None
+                    evaluating = test_data and ((scheduler.due() if evaluation_interval else at_flag) or (last and (scheduler.sample is not None or evaluation_interval or stop_reason is not None)))
+                    if trainer and (at_flag or evaluating):
+                        with profiler.phase('parallel_wait'):
+                            trainer.wait()
+                    if evaluating:
+                        # The whole test data is evaluated at the end of the epoch when the flags use a subsample or a time interval
+                        with profiler.phase('evaluate'):
+                            scheduler.submit((i + 1, f + 1), full = last)
+                    if at_flag:
+                        if fpe_index != len(fpe) - 1:
+                            fpe_index += 1
+                        if not test_data or evaluation_interval:
+                            message = "\nEpoch {0}/{1} : [mini-batch {2} / {3}]".format(i + 1, str(epochs), str(f + 1), str(n_mini_batches))
+                            if verbose:
+                                with profiler.phase('report'):
+                                    report(message, output)
+                            if not test_data and current_eta >= min_eta:
+                                current_eta *= 0.9
+                        if display_weights:
+                            with profiler.phase('weights_snapshot'):
+                                renderer.add(self.weights[0])
                     if test_data:
-                        accuracy = 100 * self.evaluate(test_data) / n_test
-                        accuracies.append(accuracy)
-                        states.append((accuracy, self.biases, self.weights))
-                        message += " => Accuracy : {0}%".format(str(accuracy))
-                    if verbose:
-                        if gui:
-                            gui.output.insert(tk.END, message)
-                            gui.update_idletasks()
-                            gui.output.see("end")
-                        else:
-                            print(message)                    
-                    if current_eta >= min_eta:
-                        if test_data:
-                            current_eta *= (1 - ((accuracy - (sum(accuracies) / len(accuracies))) / 100))
-                        else:
-                            current_eta *= 0.9
-                    if display_weights:
-                        file_count += 1
-                        self.update_plot_weights(fig, fig_size, training_num, file_count)
+                        # The evaluations are consumed in their order as soon as they are finished (at the latest at the end of the epoch)
+                        for (epoch, batch), accuracy, n_evaluated, biases, weights, cost in scheduler.results(wait = last):
+                            accuracies.append(accuracy)
+                            if restore_best and n_evaluated == n_test:
+                                with profiler.phase('checkpoint'):
+                                    keeper.offer(stopper.score(accuracy, cost) if stopper else accuracy, biases, weights, (epoch, batch, accuracy))
+                            if stopper and n_evaluated == n_test and stop_reason is None:
+                                stop_reason = stopper.evaluation_reason(accuracy, cost)
+                            message = "\nEpoch {0}/{1} : [mini-batch {2} / {3}] => Accuracy : {4}%".format(epoch, str(epochs), str(batch), str(n_mini_batches), str(accuracy))
+                            if n_evaluated != n_test:
+                                message += " (on {} test examples)".format(n_evaluated)
+                            if verbose:
+                                with profiler.phase('report'):
+                                    report(message, output)
+                            if current_eta >= min_eta:
+                                current_eta *= (1 - ((accuracy - (sum(accuracies) / len(accuracies))) / 100))
+                    if stop_reason is not None:
+                        break
+                if stop_reason is not None:
+                    txt = "\n\nTraining stopped during epoch {0}/{1} : {2}\n".format(i + 1, epochs, stop_reason)
+                    report(txt, output)
+                    break
+                with profiler.phase('report'):
+                    if test_data:
+                        txt = "\n\nEpoch n°{0} completed. Accuracy of the model at this state : {1}%, eta = {2:.2f}\n".format(i + 1, accuracy, current_eta)
+                        report(txt, output)
+                    else:
+                        txt = "\n\nEpoch n°{0} completed.".format(i + 1)
+                        report(txt, output)
+        finally:
+            if trainer:
+                trainer.stop()
             if test_data:
-                txt = "\n\nEpoch n°{0} completed. Accuracy of the model at this state : {1}%, eta = {2:.2f}\n".format(i + 1, accuracy, current_eta)
-                if gui:
-                    gui.output.insert(tk.END, txt)
-                    gui.update_idletasks()
-                    gui.output.see("end")
-                else:
-                    print(txt)
-            else:
-                txt = "\n\nEpoch n°{0} completed.".format(i + 1)
-                if gui:
-                    gui.output.insert(tk.END, txt)
-                    gui.update_idletasks()
-                    gui.output.see("end")
-                else:
-                    print(txt)
+                scheduler.close()
+            if display_weights:
+                with profiler.phase('weights_rendering_wait'):
+                    renderer.stop()
         if test_data:
-            self.plot_accuracy_graph(mini_batch_size, eta, flags_per_epoch, accuracies, training_num, dropout_value)
-            if optimize_accuracy:
-                saved_state = sorted(states)[-1]
-                self.biases, self.weights = (saved_state[1], saved_state[2])
+            # With a time interval, the number of evaluations per epoch varies : the graph's epochs are then placed from their average
+            evaluations_per_epoch = max(1, round((len(accuracies) - 1) / (i + 1))) if evaluation_interval else flags_per_epoch
+            with profiler.phase('plot_accuracy_graph'):
+                self.plot_accuracy_graph(mini_batch_size, eta, evaluations_per_epoch, accuracies, training_num, dropout_value)
+        if keeper:
+            txt = ""
+            if ema_decay is not None:
+                # The moving average becomes the model, and competes with the kept states when the best one is restored
+                self.biases, self.weights = [b.copy() for b in keeper.ema[0]], [w.copy() for w in keeper.ema[1]]
+                txt = "\nThe model takes the exponential moving average of its weights and biases (decay = {})\n".format(ema_decay)
+                if restore_best:
+                    accuracy = 100 * self.evaluate(test_data) / n_test
+                    score = stopper.score(accuracy, self.test_cost(test_data) if monitor == 'cost' else None) if stopper else accuracy
+                    keeper.offer(score, self.biases, self.weights, ('ema', None, accuracy))
+            if restore_best and keeper.heap:
+                score, (epoch, batch, accuracy) = keeper.restore()
+                if epoch == 'ema':
+                    txt = "\nBest state restored : the exponential moving average of the weights and biases, accuracy = {}%\n".format(accuracy)
+                else:
+                    txt = "\nBest state restored : epoch {}, mini-batch {}, accuracy = {}%\n".format(epoch, batch, accuracy)
+            if txt:
+                report(txt, output)
         if display_weights:
-            import glob
-            os.chdir("trainings/training_{}/weight_plots".format(str(training_num)))
-            gif_name = 'training_animation'
-            file_list = glob.glob('*.png') 
-            list.sort(file_list, key=lambda x: int(x.split('_')[1].split('.png')[0])) 
-            with open('image_list.txt', 'w') as file:
-                for item in file_list:
-                    file.write("%s\n" % item)
-            os.system('convert @image_list.txt {}.gif'.format(gif_name))
-            os.remove('image_list.txt')
-            os.chdir("../../../")
-
-    def update_mini_batch(self, mini_batch, eta, dropout_value):
-        nabla_b = [np.zeros(b.shape) for b in self.biases]
-        nabla_w = [np.zeros(w.shape) for w in self.weights]
-        for x,y in mini_batch:
-            delta_nabla_b, delta_nabla_w = self.backprop(x,y, dropout_value)
-            nabla_b = [nb + dnb for nb,dnb in zip(nabla_b, delta_nabla_b)]
-            nabla_w = [nw + dnw for nw,dnw in zip(nabla_w, delta_nabla_w)]
-        self.biases = [b - eta * (nb / len(mini_batch)) for b,nb in zip(self.biases, nabla_b)]
-        self.weights = [w - eta * (nw / len(mini_batch)) for w,nw in zip(self.weights, nabla_w)]
-
-    def backprop(self, x, y, dropout_value):
-        delta_nabla_b = [np.zeros(b.shape) for b in self.biases]
-        delta_nabla_w = [np.zeros(w.shape) for w in self.weights]
+            txt = "\nThe weights' training animation is saved in {}\n".format(renderer.gif_path)
+            if renderer.dropped:
+                txt += "({} weights snapshot(s) were dropped, the rendering being too slow)\n".format(renderer.dropped)
+            report(txt, output)
+        if profiler:
+            profiler.stop()
+            profiler.export_chrome_trace("trainings/training_{}/profile_trace.json".format(str(training_num)))
+            txt = profiler.summary() + "\n(Chrome trace exported in trainings/training_{}/profile_trace.json)\n".format(str(training_num))
+            if profiler.dropped_events():
+                txt += "(the trace holds the last {} phase calls, {} earlier ones were dropped)\n".format(len(profiler.events), profiler.dropped_events())
+            report(txt, output)
+        return stop_reason
+
+    def mini_batches(self, training_data, mini_batch_size, workspace):
+        # Yields the (x, y) mini-batches of an epoch, stacked column by column into the workspace buffers
+        # Array and list training data are shuffled through a permutation of their indexes, and each mini-batch is gathered only when it is needed
+        if is_indexable_data(training_data):
+            for indexes in mini_batch_indexes(data_length(training_data), mini_batch_size):
+                yield self.select_mini_batch(training_data, indexes, workspace)
+        else:
+            mini_batch = []
+            for example in (training_data() if callable(training_data) else training_data):
+                mini_batch.append(example)
+                if len(mini_batch) == mini_batch_size:
+                    yield self.stack_mini_batch(mini_batch, workspace)
+                    mini_batch = []
+            if mini_batch:
+                yield self.stack_mini_batch(mini_batch, workspace)
+
+    def select_mini_batch(self, training_data, indexes, workspace):
+        if is_array_data(training_data):
+            return self.gather_mini_batch(training_data[0], training_data[1], indexes, workspace)
+        return self.stack_mini_batch([training_data[j] for j in indexes], workspace)
+
+    def stack_mini_batch(self, mini_batch, workspace):
+        buffers = workspace.batch(len(mini_batch))
+        x = np.concatenate([x.T for x,y in mini_batch], axis=0, out=buffers['x'])
+        y = np.concatenate([y.T for x,y in mini_batch], axis=0, out=buffers['y'])
+        return (x.T, y.T)
+
+    def gather_mini_batch(self, inputs, outputs, indexes, workspace):
+        buffers = workspace.batch(len(indexes))
+        x, y = buffers['x'], buffers['y']
+        if inputs.dtype == x.dtype:
+            np.take(inputs, indexes, axis=0, out=x)
+        else:
+            x[...] = inputs[indexes]
+        if outputs.ndim == 1:
+            y.fill(0)
+            y[np.arange(len(indexes)), outputs[indexes]] = 1
+        else:
+            y[...] = outputs[indexes]
+        return (x.T, y.T)
+
+    def update_mini_batch(self, mini_batch, eta, dropout_value, workspace = None):
+        if workspace is None:
+            workspace = Workspace(self.sizes, self.dtype)
+        x, y = self.stack_mini_batch(mini_batch, workspace)
+        self.update_stacked_mini_batch(x, y, eta, dropout_value, workspace)
+
+    def update_stacked_mini_batch(self, x, y, eta, dropout_value, workspace, profiler = NULL_PROFILER, optimizer = None):
+        with profiler.phase('backprop'):
+            nabla_b, nabla_w = self.backprop(x, y, dropout_value, workspace)
+        with profiler.phase('update'):
+            if optimizer:
+                optimizer.step(self.biases + self.weights, nabla_b + nabla_w, eta, x.shape[1])
+                return
+            for b,w,nb,nw in zip(self.biases, self.weights, nabla_b, nabla_w):
+                nb *= eta / x.shape[1]
+                nw *= eta / x.shape[1]
+                b -= nb
+                w -= nw
+
+    def backprop(self, x, y, dropout_value, workspace = None):
+        # x and y are either single column matrixes or whole mini-batches stacked column by column, in which case the returned gradient is summed over the batch
+        # Every intermediate result is written into the workspace buffers, and the returned gradient lists are the workspace's own gradient buffers
+        if workspace is None:
+            workspace = Workspace(self.sizes, self.dtype)
+        x = np.asarray(x, dtype=self.dtype)
+        y = np.asarray(y, dtype=self.dtype)
+        buffers = workspace.batch(x.shape[1])
+        outputs, derivatives, deltas = buffers['outputs'], buffers['derivatives'], buffers['deltas']
+        delta_nabla_b, delta_nabla_w = workspace.nabla_b, workspace.nabla_w
         activation = x
         activations = [x]
-        zs = []
-        for b,w in zip(self.biases, self.weights):
-            z = np.dot(w,activation) + b
-            zs.append(z)
-            activation = self.activation_function(z)
+        softmax_output = self.softmax_output()
+        for k,(b,w) in enumerate(zip(self.biases, self.weights)):
+            z = np.dot(w, activation, out=outputs[k])
+            z += b
+            # The softmax output layer keeps its inputs z, which the softmax regulation turns into the outputs
+            activation = z if softmax_output and k == self.num_layers - 2 else self.activation_function(z, out=outputs[k])
             if dropout_value:
-                activation = self.dropout(activation, dropout_value)
+                activation = self.dropout(activation, dropout_value, out=buffers['dropped'][k], mask=buffers['masks'][k], rng=workspace.rng)
             activations.append(activation)
-        delta = self.quadratic_cost_derivative(self.regu(activations[-1]), y) * self.regu_derivative(activations[-1]) * self.activation_function_derivative(zs[-1])
-        delta_nabla_b[-1] = delta
-        delta_nabla_w[-1] = np.dot(delta, activations[-2].transpose())
+        if self.cost_name == 'cross_entropy':
+            # The derivative of the cross-entropy with respect to the softmax's input z (or to the sigmoid's input z) simplifies to a - y
+            if softmax_output:
+                delta = np.subtract(softmax(activations[-1], out=deltas[-1]), y, out=deltas[-1])
+            else:
+                delta = np.subtract(activations[-1], y, out=deltas[-1])
+        else:
+            delta = self.quadratic_cost_derivative(self.regu(activations[-1]), y, out=deltas[-1])
+            if self.regu_name:
+                delta *= self.regu_derivative(activations[-1])
+            delta *= self.activation_function_derivative(output=outputs[-1], out=derivatives[-1])
+        np.sum(delta, axis=1, keepdims=True, out=delta_nabla_b[-1])
+        np.dot(delta, activations[-2].transpose(), out=delta_nabla_w[-1])
         for l in range(2, self.num_layers):
-            z = zs[-l]
-            sp = self.activation_function_derivative(z)
-            delta = np.dot(self.weights[-l+1].transpose(), delta) * sp
-            delta_nabla_b[-l] = delta
-            delta_nabla_w[-l] = np.dot(delta, activations[-l-1].transpose())
+            delta = np.dot(self.weights[-l+1].transpose(), delta, out=deltas[-l])
+            delta *= self.activation_function_derivative(output=outputs[-l], out=derivatives[-l])
+            np.sum(delta, axis=1, keepdims=True, out=delta_nabla_b[-l])
+            np.dot(delta, activations[-l-1].transpose(), out=delta_nabla_w[-l])
         return (delta_nabla_b, delta_nabla_w)
 
-    def activation_function(self, x):
-        if self.activation_function_name == 'sigmoid':
-            return 1 / (1 + np.exp(-x))
-        elif self.activation_function_name == 'relu':
-            return np.maximum(0,x)
-        elif self.activation_function_name == 'tanh':
-            return np.tanh(x)
-
-    def activation_function_derivative(self, x):
-        if self.activation_function_name == 'sigmoid':
-            return self.activation_function(x) * (1 - self.activation_function(x))
-        elif self.activation_function_name == 'relu':
-            derivs = []
-            for activation in x:
-                if activation <= 0:
-                    derivs.append(0)
-                else:
-                    derivs.append(1)
-            return np.array(derivs).reshape(x.shape)
-        elif self.activation_function_name == 'tanh':
-            return 1 - self.activation_function(x) * self.activation_function(x)
-
-    def regu(self, x):
-        with warnings.catch_warnings():
-            warnings.filterwarnings('error')
-            try:
-                if not self.regu_name:
-                    return x
-                elif self.regu_name == 'normalization':
-                    sum = np.sum(x) 
-                    if sum != 0:
-                        return x / np.sum(x) 
-                    else:
-                        return x
-                elif self.regu_name == 'softmax':
-                    exps = np.exp(x)
-                    sum = np.sum(exps)
-                    if sum != 0:
-                        return exps / np.sum(exps)
-                    else:
-                        return x
-            except Warning: 
-                if self.regu_name == 'softmax': 
-                    print("normalization error : exps = ", exps)
-                elif self.regu_name == 'normalization':
-                    print("normalization error : np.sum(x) = ",np.sum(x), '\nx = ', x)
-                elif not self.regu_name:
-                    print(x)
+    def softmax_output(self):
+        # With the cross-entropy cost and the softmax regulation, the output layer has no activation function : its outputs are the softmax of its inputs z, and the cost's gradient with respect to z is softmax(z) - y
+        return self.cost_name == 'cross_entropy' and self.regu_name == 'softmax'
+
+    def activation_function(self, x, out = None):
+        return ACTIVATION_FUNCTIONS[self.activation_function_name][0](x, out=out)
+
+    def activation_function_derivative(self, x = None, output = None, out = None):
+        # The derivative is computed from the activation function's output when it is already known, and from the input x otherwise
+        if output is None:
+            output = self.activation_function(x)
+        return ACTIVATION_FUNCTIONS[self.activation_function_name][1](output, out=out)
+
+    def regu(self, x, out = None):
+        # The regulation is applied column by column, so that a stacked mini-batch is regulated sample by sample
+        if not self.regu_name:
+            return x
+        elif self.regu_name == 'normalization':
+            # The columns of null activations are left untouched
+            sums = np.sum(x, axis=0, keepdims=True)
+            sums[sums == 0] = 1
+            return np.divide(x, sums, out=out)
+        elif self.regu_name == 'softmax':
+            return softmax(x, out=out)
 
     def regu_derivative(self, x):
         if not self.regu_name:
             return 1
-        elif self.regu_name == 'softmax':
-            if sum(x) != 0:
-                return self.regu(x) * (1 - self.regu(x))
-            else:
-                return 1
+        sums = np.sum(x, axis=0, keepdims=True)
+        if self.regu_name == 'softmax':
+            regu = self.regu(x)
+            return np.where(sums != 0, regu * (1 - regu), 1)
         elif self.regu_name == 'normalization':
-            if sum(x):
-                return (1 / sum(x)) * (1 - self.regu(x))
-            else:
-                return 1
+            return np.where(sums != 0, (1 - self.regu(x)) / np.where(sums != 0, sums, 1), 1)
+
+    def quadratic_cost_derivative(self, output_activations, y, out = None):
+        return np.subtract(output_activations, y, out=out)
+
+    def cost(self, x, y):
+        # Returns the cost of the network on the inputs and wanted outputs x and y (single columns or stacked examples), summed over the examples
+        x = np.asarray(x, dtype=self.dtype)
+        activations = x
+        softmax_output = self.softmax_output()
+        for k,(w,b) in enumerate(zip(self.weights, self.biases)):
+            activations = w.dot(activations) + b
+            if not (softmax_output and k == self.num_layers - 2):
+                activations = self.activation_function(activations)
+        if self.cost_name == 'quadratic':
+            return 0.5 * float(np.sum((self.regu(activations) - y) ** 2))
+        if self.regu_name == 'softmax':
+            return -float(np.sum(y * log_softmax(activations)))
+        # Binary cross-entropy of sigmoid outputs, which are kept away from 0 and 1 so that their logarithms are finite
+        a = np.clip(activations, np.finfo(self.dtype).tiny, 1 - np.finfo(self.dtype).epsneg)
+        return -float(np.sum(y * np.log(a) + (1 - y) * np.log(1 - a)))
+
+    def dropout(self, x, dropout_value, out = None, mask = None, rng = None):
+        # The mask and the dropped out activations can be written into preallocated buffers, the mask being drawn from the given random generator
+        if mask is None:
+            mask = np.empty_like(x)
+        if rng is None:
+            rng = np.random.default_rng(np.random.randint(2**31))
+        rng.random(out=mask, dtype=mask.dtype)
+        np.less(mask, 1 - dropout_value, out=mask)
+        mask *= 1.0 / (1 - dropout_value)
+        return np.multiply(x, mask, out=out)
+
+    def evaluate(self, test_data, chunk_size = 1000):
+        # test_data is a list of (x, y) tuples, or an (inputs, labels) tuple of arrays holding one example per row
+        correct = 0
+        if is_array_data(test_data):
+            inputs, labels = test_data
+            for k in range(0, len(inputs), chunk_size):
+                correct += int(np.sum(np.argmax(self.feedforward(inputs[k:k+chunk_size].T), axis=0) == labels[k:k+chunk_size]))
+            return correct
+        test_data = list(test_data)
+        for k in range(0, len(test_data), chunk_size):
+            chunk = test_data[k:k+chunk_size]
+            x = np.hstack([x for x,y in chunk])
+            y = np.array([y for x,y in chunk]).ravel()
+            correct += int(np.sum(np.argmax(self.feedforward_batch(x, 'columns'), axis=0) == y))
+        return correct
 
-    def quadratic_cost_derivative(self, output_activations, y):
-        return (output_activations - y)
+    def test_cost(self, test_data, chunk_size = 1000):
+        # Returns the mean cost of the network on the test data (same formats as evaluate), the labels being taken as one-hot wanted outputs
+        total = 0
+        if is_array_data(test_data):
+            inputs, labels = test_data
+            chunks = ((inputs[k:k+chunk_size].T, labels[k:k+chunk_size]) for k in range(0, len(inputs), chunk_size))
+        else:
+            test_data = list(test_data)
+            chunks = ((np.hstack([x for x,y in test_data[k:k+chunk_size]]), np.array([y for x,y in test_data[k:k+chunk_size]]).ravel()) for k in range(0, len(test_data), chunk_size))
+        for x, chunk_labels in chunks:
+            y = np.zeros((self.sizes[-1], len(chunk_labels)), dtype=self.dtype)
+            y[chunk_labels.astype(int), np.arange(len(chunk_labels))] = 1
+            total += self.cost(x, y)
+        return total / data_length(test_data)
+
+    def save(self, path):
+        # Writes the model in the compact model file format (see write_model_file)
+        sparse_layers = [l for l, w in enumerate(self.weights) if not isinstance(w, np.ndarray)]
+        if not sparse_layers:
+            write_model_file(path, self.model_header(), [('biases', b) for b in self.biases] + [('weights', w) for w in self.weights])
+            return
+        # The sparse layers are written as their CSR arrays, in a version 3 file
+        arrays = [('biases', b) for b in self.biases] + [('weights', w) for w in self.weights if isinstance(w, np.ndarray)]
+        for l in sparse_layers:
+            arrays += [('sparse_data', self.weights[l].data), ('sparse_indices', self.weights[l].indices), ('sparse_indptr', self.weights[l].indptr)]
+        write_model_file(path, dict(self.model_header(), sparse_layers=sparse_layers), arrays, SPARSE_FORMAT_VERSION)
 
-    def dropout(self, x, dropout_value):
-        return x * (np.random.binomial([np.ones((len(x),1))], 1 - dropout_value) * (1.0 / (1 - dropout_value))).reshape((len(x),1))
+    def model_header(self):
+        return {'id': self.id, 'sizes': list(self.sizes), 'activation_function_name': self.activation_function_name, 'regu_name': self.regu_name, 'cost_name': self.cost_name, 'dtype': self.dtype.str}
 
-    def evaluate(self, test_data):
-        test_results = [(np.argmax(self.feedforward(x)),y) for x,y in test_data]
-        return sum(int(x == y) for x,y in test_results)
+    @classmethod
+    def load(cls, path, mmap_mode = None):
+        # Reads a model saved by save, or a pickled Network object (the format of the models saved before)
+        # With mmap_mode ('r', 'c' or 'r+', like numpy.load), the weights and biases are memory-mapped from the file instead of being read : big models open instantly, and processes opening the same file in 'r' mode share its memory
+        # The arrays mapped in 'r' mode are read-only, 'c' (copy-on-write) allows to train the model without modifying the file
+        if not is_model_file(path):
+            with open(path, "rb") as file:
+                return pickle.Unpickler(file).load()
+        header, arrays = read_model_file(path, mmap_mode)
+        if header.get('quantization'):
+            # A quantized model is read back as an inference only QuantizedNetwork
+            from quantization import QuantizedNetwork
+            return QuantizedNetwork.from_model_file(header, arrays)
+        net = cls.__new__(cls)
+        net.id = header['id']
+        net.sizes = header['sizes']
+        net.num_layers = len(net.sizes)
+        net.dtype = np.dtype(header['dtype'])
+        net.activation_function_name = header['activation_function_name']
+        net.regu_name = header['regu_name']
+        net.cost_name = header.get('cost_name', 'quadratic')
+        net.biases = arrays['biases']
+        net.weights = arrays.get('weights', [])
+        if header.get('sparse_layers'):
+            from pruning import CSRMatrix
+            for k, l in enumerate(header['sparse_layers']):
+                net.weights.insert(l, CSRMatrix(arrays['sparse_data'][k], arrays['sparse_indices'][k], arrays['sparse_indptr'][k], (net.sizes[l+1], net.sizes[l])))
+        return net
 
     def __repr__(self):
-        return "\"" + str(self.id) + "\" : " + str(self.sizes) + ", activation function : " + str(self.activation_function_name) + ", output regulation method : " + str(self.regu_name)
-
-    def update_plot_weights(self, fig, fig_size, training_num, file_count):
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            for j,weights in enumerate(self.weights[0]):
-                fig.add_subplot(fig_size, fig_size, j + 1)      
-                plt.gca().axes.xaxis.set_ticklabels([])
-                plt.gca().axes.yaxis.set_ticklabels([])
-                plt.gca().axes.get_xaxis().set_visible(False)
-                plt.gca().axes.get_yaxis().set_visible(False)
-                plt.imshow(weights.reshape(28,28), cmap='Greys')
-            fig.canvas.draw()
-            fig.canvas.flush_events()
-            plt.savefig("trainings/training_{}/weight_plots/snapshot_{}".format(str(training_num),str(file_count)))
+        return "\"" + str(self.id) + "\" : " + str(self.sizes) + ", activation function : " + str(self.activation_function_name) + ", output regulation method : " + str(self.regu_name) + ", cost function : " + str(self.cost_name)
 
     def plot_accuracy_graph(self, mini_batch_size, eta, fpe, accuracies, training_num, dropout_value):
-        plt.figure('Training graph',figsize = (8, 8))
-        x = range(len(accuracies))
-        plt.plot(x, accuracies)
-        if not dropout_value:
-            dropout_value = ""
-        else:
-            dropout_value = ", dropout : " + str(dropout_value)
-        plt.title("Training of the model \"{0}\" ({1}): batch size : {2}, starting learning rate : {3}{4}".format(self.id, self.activation_function_name, mini_batch_size, eta, dropout_value))
-        plt.xlabel("Epoch completions")
-        plt.ylabel("Accuracy (measured on the test data)")
-        axes = plt.gca()
-        axes.set_ylim([0, 100])
-        ticks = np.array(range(0, len(accuracies), fpe))
-        plt.xticks(ticks, np.array(ticks/fpe, dtype='int'))
-        plt.yticks(range(0,101,10))
-        annot_max(x, np.array(accuracies), axes, fpe)
-        plt.savefig("trainings/training_{}/training_graph".format(str(training_num)))
-
-
-#plot max annotation
-def annot_max(x, y, ax, fpe):
-    xmax = x[np.argmax(y)]
-    ymax = y.max()
-    text = "max accuracy = {:.2f}%, at epoch {}".format(ymax, ceil(xmax / fpe))        
-    if not ax:
-        ax=plt.gca()
-    bbox_props = dict(boxstyle="square,pad=0.3", fc="w", ec="k", lw=0.72)
-    arrowprops=dict(arrowstyle="->",connectionstyle="angle,angleA=0,angleB=60")
-    kw = dict(xycoords='data',textcoords="axes fraction",
-            arrowprops=arrowprops, bbox=bbox_props, ha="right", va="top")
-    ax.annotate(text, xy=(xmax, ymax), xytext=(0.9, 0.85), **kw)
+        from plotting import plot_accuracy_graph
+        plot_accuracy_graph(self, mini_batch_size, eta, fpe, accuracies, training_num, dropout_value)
+
+    def prune(self, training_data, sparsity, steps = 4, epochs = 1, mini_batch_size = 10, eta = 3, validation_data = None, layers = (0,), density_threshold = None, **sgd_arguments):
+        # Iterative magnitude pruning with fine-tuning (see the pruning module) : returns the report of the inference costs before and after the pruning (pruning.format_report writes it)
+        import pruning
+        if density_threshold is None:
+            density_threshold = pruning.SPARSE_DENSITY_THRESHOLD
+        return pruning.prune(self, training_data, sparsity, steps, epochs, mini_batch_size, eta, validation_data, layers, density_threshold, **sgd_arguments)
+
+    def sparsify(self, density_threshold = None):
+        # Stores the layers whose share of nonzero weights is below the density threshold as sparse matrixes, and returns their indexes
+        import pruning
+        return pruning.sparsify(self, pruning.SPARSE_DENSITY_THRESHOLD if density_threshold is None else density_threshold)
+
+    def densify(self):
+        if not all(isinstance(w, np.ndarray) for w in self.weights):
+            from pruning import densify
+            densify(self)
+
+
+class Workspace():
+
+    # Buffers of the training engine, allocated once per SGD call and then written in place at every mini-batch
+
+    def __init__(self, sizes, dtype = np.float64):
+        self.sizes = sizes
+        self.dtype = np.dtype(dtype)
+        self.nabla_b = [np.zeros((y,1), dtype=self.dtype) for y in sizes[1:]]
+        self.nabla_w = [np.zeros((y,x), dtype=self.dtype) for x,y in zip(sizes[:-1],sizes[1:])]
+        self.rng = np.random.default_rng(np.random.randint(2**31))
+        self.batches = {}
+
+    def batch(self, m):
+        # The per-example buffers are allocated once for each mini-batch width met (the last mini-batch of an epoch can be smaller)
+        if m not in self.batches:
+            # The stacked inputs and wanted outputs are stored one example per row, so that they can be filled by contiguous row copies and used as (784, m) matrixes through a transposition
+            self.batches[m] = {
+                'x': np.zeros((m, self.sizes[0]), dtype=self.dtype),
+                'y': np.zeros((m, self.sizes[-1]), dtype=self.dtype),
+                'outputs': [np.zeros((y, m), dtype=self.dtype) for y in self.sizes[1:]],
+                'dropped': [np.zeros((y, m), dtype=self.dtype) for y in self.sizes[1:]],
+                'masks': [np.zeros((y, m), dtype=self.dtype) for y in self.sizes[1:]],
+                'derivatives': [np.zeros((y, m), dtype=self.dtype) for y in self.sizes[1:]],
+                'deltas': [np.zeros((y, m), dtype=self.dtype) for y in self.sizes[1:]],
+            }
+        return self.batches[m]
+
+
+#training/test data helpers
+def is_array_data(data):
+    return isinstance(data, tuple) and len(data) == 2 and all(isinstance(array, np.ndarray) for array in data)
+
+def is_indexable_data(data):
+    return is_array_data(data) or (hasattr(data, '__getitem__') and hasattr(data, '__len__'))
+
+def data_length(data):
+    if is_array_data(data):
+        return len(data[0])
+    return len(data)
+
+def mini_batch_indexes(n, mini_batch_size):
+    # Yields the example indexes of the mini-batches of an epoch, drawn from a permutation of the n examples
+    # The order of the examples inside a mini-batch doesn't change its gradient, sorting the indexes makes the gathers read the arrays (or memory-mapped files) forward
+    order = np.random.permutation(n)
+    for k in range(0, n, mini_batch_size):
+        yield np.sort(order[k:k+mini_batch_size])
+
+
+#model file helpers
+#a model file holds a magic string, the length of its JSON header (4 bytes, little-endian), the JSON header describing the model and its arrays, and the raw arrays, each one starting at a multiple of MODEL_ALIGNMENT bytes
+MODEL_MAGIC = b"NNMODEL\x00"
+# The float models are written as version 1 files, the quantized models (see the quantization module) as version 2 files, which the versions of the library reading up to version 1 refuse,
+# and the models with sparse layers (see the pruning module) as version 3 files
+MODEL_FORMAT_VERSION = 3
+SPARSE_FORMAT_VERSION = 3
+MODEL_ALIGNMENT = 64
+
+def is_model_file(path):
+    with open(path, "rb") as file:
+        return file.read(len(MODEL_MAGIC)) == MODEL_MAGIC
+
+def write_model_file(path, header, arrays, format_version = 1):
+    # arrays is a list of (name, array) couples, the arrays of a same name being read back as a list in their order
+    header = dict(header, format_version=format_version, arrays=[])
+    arrays = [(name, np.ascontiguousarray(array)) for name, array in arrays]
+    # The header's length depends on the offsets it holds : the offsets are computed from a header size which is increased until the header fits in it
+    header_size = MODEL_ALIGNMENT
+    while True:
+        offset = header_size
+        header['arrays'] = []
+        for name, array in arrays:
+            header['arrays'].append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+            offset += -(-array.nbytes // MODEL_ALIGNMENT) * MODEL_ALIGNMENT
+        encoded = json.dumps(header).encode("utf-8")
+        if len(MODEL_MAGIC) + 4 + len(encoded) <= header_size:
+            break
+        header_size += MODEL_ALIGNMENT * ceil((len(MODEL_MAGIC) + 4 + len(encoded) - header_size) / MODEL_ALIGNMENT)
+    with open(path, "wb") as file:
+        file.write(MODEL_MAGIC)
+        file.write(len(encoded).to_bytes(4, "little"))
+        file.write(encoded)
+        for (name, array), description in zip(arrays, header['arrays']):
+            file.write(b"\x00" * (description['offset'] - file.tell()))
+            file.write(array.tobytes())
+
+def read_model_file(path, mmap_mode = None):
+    # Returns the header of a model file and a dictionnary of array name -> list of arrays
+    with open(path, "rb") as file:
+        if file.read(len(MODEL_MAGIC)) != MODEL_MAGIC:
+            raise ValueError("{} is not a model file".format(path))
+        header = json.loads(file.read(int.from_bytes(file.read(4), "little")).decode("utf-8"))
+        if header['format_version'] > MODEL_FORMAT_VERSION:
+            raise ValueError("{} has the model format version {}, this version of the library reads up to version {}".format(path, header['format_version'], MODEL_FORMAT_VERSION))
+        arrays = {}
+        for description in header['arrays']:
+            dtype, shape = np.dtype(description['dtype']), tuple(description['shape'])
+            if mmap_mode and np.prod(shape) > 0:
+                array = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=description['offset'], shape=shape)
+            else:
+                file.seek(description['offset'])
+                array = np.fromfile(file, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+            arrays.setdefault(description['name'], []).append(array)
+    return header, arrays
 
@@ -15,14 +15,54 @@ plt.ion() #for interactive plotting
 from PIL import Image
 import matplotlib.image as mpimg
 from math import sqrt, ceil
-import warnings
-np.seterr(all='warn')
+#Underflows to zero (for instance exp(-1000) in the sigmoid) are harmless : we don't warn about them
+np.seterr(all='warn', under='ignore')
+
+#The activation functions are stored in a table, each one with its derivative
+#The derivatives are expressed from the output a = f(z) of the activation function, which the forward pass has already computed : backpropagating costs no extra exponential or tanh call
+def sigmoid(z):
+    return 1 / (1 + np.exp(-z))
+
+def sigmoid_derivative(a):
+    #sigmoid' = sigmoid(1 - sigmoid)
+    return a * (1 - a)
+
+def relu(z):
+    return np.maximum(0, z)
+
+def relu_derivative(a):
+    #relu' = 0 if z <= 0 and relu' = 1 if z > 0 (and relu(z) > 0 exactly when z > 0)
+    return (a > 0).astype(a.dtype)
+
+def tanh(z):
+    return np.tanh(z)
+
+def tanh_derivative(a):
+    #tanh' = 1 - tanh²
+    return 1 - a * a
+
+ACTIVATION_FUNCTIONS = {
+    'sigmoid': (sigmoid, sigmoid_derivative),
+    'relu': (relu, relu_derivative),
+    'tanh': (tanh, tanh_derivative),
+}
+
+#The softmax regulation turns the last layer's activations into probabilities
+#softmax(x) = softmax(x - max(x)) : subtracting the maximum of each column before the exponentials keeps them between 0 and 1, so that they never overflow
+def softmax(x):
+    exps = np.exp(x - np.max(x, axis=0, keepdims=True))
+    return exps / np.sum(exps, axis=0, keepdims=True)
+
+#log(softmax(x)) = (x - max(x)) - log(sum(exp(x - max(x)))) : computing it directly avoids taking the logarithm of a probability rounded to 0
+def log_softmax(x):
+    shifted = x - np.max(x, axis=0, keepdims=True)
+    return shifted - np.log(np.sum(np.exp(shifted), axis=0, keepdims=True))
 
 class Network():
 
     """The Network class, modeling a feedforward neural network, trainable with standard SGD/backpropagation algorithm method"""
 
-    def __init__(self, id, sizes, activation_function_name = 'sigmoid', regu_name = None):
+    def __init__(self, id, sizes, activation_function_name = 'sigmoid', regu_name = None, cost_name = 'quadratic'):
         """
         Network instance constructor. It assigns six descriptives attributes : 
             - Two attributes modeling the shape of the network :
@@ -33,6 +73,7 @@ class Network():
                 - "weights", A list of 2D-matrixes, each containing the weights of the synapses leading to each neuron in a given layer (one neuron = one matrix line, one synapse = one matrix column)
             - The activation function name (a non-linear function applying to each layer's output): by default, sigmoid
             - The network's output regulation method (a non-linear function applying to the model's last layer's output) : by default, None
+            - The cost function minimized by the training : 'quadratic' by default, or 'cross_entropy' (which needs probabilities as outputs : a softmax regulation, or sigmoid activations without regulation)
         And an identifier "id"
         For instance, to create a Network with an input layer of 784 neurons, a hidden layer of 15 neurons, and an output layer of 10 neurons (sigmoid activation, no regulation), you should do : "net = Network("net", [784,15,10])"
         """
@@ -47,13 +88,15 @@ class Network():
         self.id = str(id)
         self.activation_function_name = activation_function_name
         self.regu_name = regu_name
+        self.cost_name = cost_name
         
     def feedforward(self, a):
         """This method returns the output of the network, given : the input a in parameter (in a matrix column form), the weights and biases of the model, the activation/regulation functions, and the network's output shape"""
         for w,b in zip(self.weights, self.biases):
             #A' = activation_function(W.A+B)
-            a = self.regu(self.activation_function(np.dot(w, a) + b))
-        return a
+            a = self.activation_function(np.dot(w, a) + b)
+        #The regulation only applies to the output of the last layer
+        return self.regu(a)
 
     def SGD(self, training_data, epochs, mini_batch_size, eta = 3, min_eta = 1.5, test_data = None, flags_per_epoch = 5, Verbose=True, dropout_value = None, optimize_accuracy=False):
         """
@@ -130,15 +173,12 @@ class Network():
             
     def update_mini_batch(self, mini_batch, eta, dropout_value):
         """This method applies the SGD to each weight and bias of the network given a mini-batch of training examples"""
-        #We sum the delta_nablas (gradients of the cost function with respect to each weight and bias in the network) over all the training examples in the mini-batch
-        nabla_b = [np.zeros(b.shape) for b in self.biases]
-        nabla_w = [np.zeros(w.shape) for w in self.weights]
-        for x, y in mini_batch:
-            #All the partial derivatives for each weight and each bias are calculated via backpropagation
-            delta_nabla_b, delta_nabla_w = self.backprop(x, y, dropout_value)
-            #We sum them
-            nabla_b = [nb + dnb for nb, dnb in zip(nabla_b, delta_nabla_b)]
-            nabla_w = [nw + dnw for nw, dnw in zip(nabla_w, delta_nabla_w)]
+        #The mini-batch is stacked into two matrixes, one training example per column (inputs of shape (784, m) and wanted outputs of shape (10, m) for mnist)
+        #This way, the whole mini-batch is backpropagated at once with matrix-matrix products instead of looping over the training examples one by one
+        x = np.hstack([x for x, y in mini_batch])
+        y = np.hstack([y for x, y in mini_batch])
+        #All the partial derivatives for each weight and each bias are calculated via backpropagation, and summed over all the training examples in the mini-batch
+        nabla_b, nabla_w = self.backprop(x, y, dropout_value)
         #And dividing the sum to get a mean over the mini_batch, we apply a stochastic gradient descent to each weight and bias of the network (according to the learning rate)
         self.biases = [b - eta * (nb / len(mini_batch)) for b, nb in zip(self.biases, nabla_b)]
         self.weights = [w - eta * (nw / len(mini_batch)) for w, nw in zip(self.weights, nabla_w)]
@@ -149,6 +189,7 @@ class Network():
         """
         This method returns the gradient of the quadratic cost function (a function representing the square of the distance between the wanted output and the current network's output)
         The gradient is calculated with respect to each weight and each bias of each neuron in the network for a given training example x and its wanted output y (both are column matrixes).
+        x and y can also be whole mini-batches stacked column by column : the returned gradient is then the sum of the gradients of each training example
         The returned gradient is a tuple of (the gradient with respect to the biases, the gradient with respect to the weights)
         The two parts of the returned gradient are lists of matrixes shaped respectively like the biases and weights matrixes of the network instance
         """
@@ -157,40 +198,46 @@ class Network():
         delta_nabla_w = [np.zeros(w.shape) for w in self.weights]
         activation = x
         activations = [x] # list to store all the activations, layer by layer
-        zs = [] #list to store all the z vectors, layer by layer
+        outputs = [] #list to store all the activation function outputs (before dropout), layer by layer
         #z = w.a + b and we feed z into the activation function (activation(z) = x)
         #We need to have access to each input and each output of each neuron of the network to apply the backpropagation algorithm. Hence, we:
-        # - calculate each w.x+b = z at each layer and store them in zs as a list of column matrixes
+        # - calculate each w.x+b = z at each layer, and store sigmoid(z) in the outputs list as a list of column matrixes (the derivatives are computed from theese outputs)
         # - store sigmoid(z) in the activations list for each layer (and apply dropout if specified)
         for b, w in zip(self.biases, self.weights):
             z = np.dot(w, activation)+b
-            zs.append(z)
             activation = self.activation_function(z)
+            outputs.append(activation)
             #We apply dropout at this moment, setting some of the activations to zero (theese will have a zero gradient)
             if dropout_value:
                 activation = self.dropout(activation, dropout_value)
             activations.append(activation)
-        #Once we have calculated the zs ans activations, we can start backpropagating
+        #Once we have calculated the outputs ans activations, we can start backpropagating
         #First, we calculate the gradient of the output layer with a chain rule
-        #delta is the product of : the partial derivative of the quadratic cost with respect to the output of the regulation function,
-        #the partial derivative of the regulation function with respect to the activation function outputs, and the partial derivative of the activations with respect to the inputs z=w.x+b
-        delta = self.quadratic_cost_derivative(self.regu(activations[-1]), y) * self.regu_derivative(activations[-1]) * self.activation_function_derivative(zs[-1])
-        #the partial derivative of the input z=w.x+b with respect to the biases is always 1. Hence, dCost/db = delta
-        delta_nabla_b[-1] = delta
+        if self.cost_name == 'cross_entropy':
+            #The cross-entropy cost is C = -sum(y * log(softmax(a))). Its derivative with respect to the input a of the softmax simplifies to softmax(a) - y,
+            #and with sigmoid outputs without regulation, C = -sum(y * log(a) + (1 - y) * log(1 - a)), whose derivative with respect to z simplifies to a - y (the sigmoid derivative cancels out)
+            if self.regu_name == 'softmax':
+                delta = (softmax(activations[-1]) - y) * self.activation_function_derivative(output=outputs[-1])
+            else:
+                delta = activations[-1] - y
+        else:
+            #delta is the product of : the partial derivative of the quadratic cost with respect to the output of the regulation function,
+            #the partial derivative of the regulation function with respect to the activation function outputs, and the partial derivative of the activations with respect to the inputs z=w.x+b
+            delta = self.quadratic_cost_derivative(self.regu(activations[-1]), y) * self.regu_derivative(activations[-1]) * self.activation_function_derivative(output=outputs[-1])
+        #the partial derivative of the input z=w.x+b with respect to the biases is always 1. Hence, dCost/db = delta (summed over the columns of a stacked mini-batch)
+        delta_nabla_b[-1] = np.sum(delta, axis=1, keepdims=True)
         #the partial derivative of the input z=w.x+b with respect to the weights is the sum of the outputs of the last layer for each output neuron. Hence, dCost/dw = delta * sum(activations_of_last_layer) -> matrix product [(n,1) * (1,n) = (n,n)]
         delta_nabla_w[-1] = np.dot(delta, activations[-2].transpose())
         #Then, for each layer from the lasts to the firsts, we backpropagate the partial derivatives
         for l in range(2, self.num_layers): #For each hidden layer
-            #We retrieve the input activations z=w.x+b
-            z = zs[-l]
-            #And store the partial derivatives of the activation function with respect to the activation
-            sp = self.activation_function_derivative(z)
+            #We store the partial derivatives of the activation function with respect to the input activations z=w.x+b, computed from the outputs of the forward pass
+            sp = self.activation_function_derivative(output=outputs[-l])
             #With this data in hand, we can calculate a new derivative of the cost with respect to the output of the current hidden layer.
             #The delta of the current layer is equal to sp * the sum of the products of the delta of the next layer and the weights of the next layer -> matrix product
             #We use the transpose weights matrix because we want to calculate delta for each neuron of the lth layer regarding its synapses which link it to the l+1th layer
             delta = np.dot(self.weights[-l + 1].transpose(), delta) * sp
             #Once again, with delta in hand, the partial derivative of each bias with respect to the input activation is 1 -> the partial derivative is delta
-            delta_nabla_b[-l] = delta
+            delta_nabla_b[-l] = np.sum(delta, axis=1, keepdims=True)
             #And in the same way, the partial derivative of the weights with respect to the input activation z=w.x+b, is the sum of the activations of the precedent layer -> matrix product
             delta_nabla_w[-l] = np.dot(delta, activations[-l - 1].transpose())
         #In the end, each matrix of the gradient has been calculated, we can return the gradient for the training example x,y
@@ -198,77 +245,41 @@ class Network():
 
     def activation_function(self, x):
         """This method computes the network's outputs activation function (sigmoid,relu,tanh)"""
-        if self.activation_function_name == 'sigmoid':
-            return 1 / (1 + np.exp(-x))
-        elif self.activation_function_name == 'relu':
-            return np.maximum(0,x)
-        elif self.activation_function_name == 'tanh':
-            return np.tanh(x)
+        return ACTIVATION_FUNCTIONS[self.activation_function_name][0](x)
 
-    def activation_function_derivative(self, x):
-        """This method computes the derivative of the network's outputs activation function (sigmoid,relu,tanh)"""
-        if self.activation_function_name == 'sigmoid':
-            #sigmoid' = sigmoid(1 - sigmoid)
-            return self.activation_function(x) * (1 - self.activation_function(x))
-        elif self.activation_function_name == 'relu':
-            derivs = []
-            for activation in x:
-                if activation <= 0:
-                    derivs.append(0)
-                else:
-                    derivs.append(1)
-            #relu' = 0 if x <= 0 and relu' = 1 if x > 0
-            return np.array(derivs).reshape(x.shape)
-        elif self.activation_function_name == 'tanh':
-            #tanh' = 1 - tanh²
-            return 1 - self.activation_function(x) * self.activation_function(x)
+    def activation_function_derivative(self, x = None, output = None):
+        """This method computes the derivative of the network's outputs activation function (sigmoid,relu,tanh), from the activation function's output if it is given, and from its input x otherwise"""
+        if output is None:
+            output = self.activation_function(x)
+        return ACTIVATION_FUNCTIONS[self.activation_function_name][1](output)
 
     def regu(self, x):
         """This method computes the network's output regulation function (softmax,normalization,none)"""
-        #We catch the normalization/softmax errors because they generate exploding/vanishing output values sometimes, resulting in value errors
-        with warnings.catch_warnings():
-            warnings.filterwarnings('error')
-            try:
-                if not self.regu_name:
-                    return x
-                elif self.regu_name == 'normalization':
-                    sum = np.sum(x) 
-                    if sum != 0: #We have to check wether the activations are null to avoid a ZeroDivisionError (even if it is very unlikely)
-                        return x / np.sum(x) 
-                    else:
-                        return x
-                elif self.regu_name == 'softmax':
-                    exps = np.exp(x)
-                    sum = np.sum(exps)
-                    if sum != 0:
-                        return exps / np.sum(exps)
-                    else:
-                        return x
-            except Warning: 
-                if self.regu_name == 'softmax': 
-                    print("softmax error : exps = ", exps)
-                elif self.regu_name == 'normalization':
-                    print("normalization error : np.sum(x) = ",np.sum(x), '\nx = ', x)
-                elif not self.regu_name:
-                    print(x)
+        #The regulation is applied column by column : a stacked mini-batch is regulated training example by training example
+        if not self.regu_name:
+            return x
+        elif self.regu_name == 'normalization':
+            sums = np.sum(x, axis=0, keepdims=True)
+            #We have to check wether the activations are null to avoid a ZeroDivisionError (even if it is very unlikely) : such columns are left untouched
+            return x / np.where(sums != 0, sums, 1)
+        elif self.regu_name == 'softmax':
+            #The max-shifted softmax never overflows, and its sums are at least 1
+            return softmax(x)
 
     def regu_derivative(self, x):
         """This method computes the derivative of the network's output regulation function (softmax,normalization,none)"""
         if not self.regu_name:
             #No influence
             return 1
-        elif self.regu_name == 'softmax':
-            if sum(x): #making sure there is no 0/infinite output problem
-                #softmax' = softmax(1 - softmax)
-                return self.regu(x) * (1 - self.regu(x))
-            else:
-                return 1                
+        #making sure there is no 0/infinite output problem (column by column)
+        sums = np.sum(x, axis=0, keepdims=True)
+        if self.regu_name == 'softmax':
+            #softmax' = softmax(1 - softmax)
+            regu = self.regu(x)
+            return np.where(sums != 0, regu * (1 - regu), 1)
         elif self.regu_name == 'normalization':
-            if sum(x):                
-                #norm' = (sum(x) - x) / sum(x)²
-                return (1 / sum(x)) * (1 - self.regu(x))
-            else: #If the output activations are zero, the derivative is set to 0 to simplify (very unlikely)
-                return 1
+            #norm' = (sum(x) - x) / sum(x)²
+            return np.where(sums != 0, (1 - self.regu(x)) / np.where(sums != 0, sums, 1), 1)
 
     def quadratic_cost_derivative(self, output_activations, y):
         """This method returns the derivative of the quadratic cost function with respect to the output activations of the last layer"""
@@ -276,7 +287,7 @@ class Network():
 
     def dropout(self, x, dropout_value):
         """This method applies dropout on the layer's activations vector "x". It also compensates the activation loss by proportionally boosting the activated outputs"""
-        return x * (np.random.binomial([np.ones((len(x),1))], 1 - dropout_value) * (1.0 / (1 - dropout_value))).reshape((len(x),1))
+        return x * (np.random.binomial(1, 1 - dropout_value, size=x.shape) * (1.0 / (1 - dropout_value)))
 
     def evaluate(self, test_data):
         """This method is used to evaluate the accuracy of the model during its training on a given test data-set"""
@@ -0,0 +1,150 @@
+# -*- coding:utf-8 -*-
+
+"""
+Update rules of the weights and biases during the training.
+An optimizer is created for a network : it allocates its state (velocities, moving averages of the gradients...) once, with one array per weight and bias array, and then updates the parameters in place at each mini-batch.
+The gradients given to an optimizer are summed over the mini-batch (as returned by Network.backprop), and their buffers are used as scratch space.
+It is used through the "optimizer" argument of Network.SGD, which takes the name of an optimizer (see OPTIMIZERS) or an optimizer instance
+"""
+
+import numpy as np
+
+
+class GradientDescent():
+
+    # Plain gradient descent : p -= eta * g
+
+    def __init__(self, net):
+        self.shapes = [b.shape for b in net.biases] + [w.shape for w in net.weights]
+        self.dtype = net.dtype
+
+    def state(self):
+        # One zero array per weight and bias array
+        return [np.zeros(shape, dtype=self.dtype) for shape in self.shapes]
+
+    def step(self, parameters, gradients, eta, batch_size):
+        # parameters and gradients are the lists of biases and weights arrays and of their summed gradients
+        for k, (parameter, gradient) in enumerate(zip(parameters, gradients)):
+            gradient *= 1 / batch_size
+            self.update(k, parameter, gradient, eta)
+
+    def update(self, k, parameter, gradient, eta):
+        gradient *= eta
+        parameter -= gradient
+
+
+class Momentum(GradientDescent):
+
+    # v = momentum * v - eta * g, p += v
+
+    def __init__(self, net, momentum = 0.9):
+        GradientDescent.__init__(self, net)
+        self.momentum = momentum
+        self.velocities = self.state()
+
+    def update(self, k, parameter, gradient, eta):
+        velocity = self.velocities[k]
+        gradient *= eta
+        velocity *= self.momentum
+        velocity -= gradient
+        parameter += velocity
+
+
+class Nesterov(Momentum):
+
+    # Nesterov's accelerated gradient, written for the current parameters rather than the looked-ahead ones : v = momentum * v - eta * g, p += momentum * v - eta * g
+
+    def update(self, k, parameter, gradient, eta):
+        velocity = self.velocities[k]
+        gradient *= eta
+        velocity *= self.momentum
+        velocity -= gradient
+        parameter -= gradient
+        np.multiply(velocity, self.momentum, out=gradient)
+        parameter += gradient
+
+
+class RMSProp(GradientDescent):
+
+    # s = decay * s + (1 - decay) * g², p -= eta * g / (sqrt(s) + epsilon)
+
+    def __init__(self, net, decay = 0.9, epsilon = 1e-8):
+        GradientDescent.__init__(self, net)
+        self.decay = decay
+        self.epsilon = epsilon
+        self.squares = self.state()
+        self.scratch = self.state()
+
+    def update(self, k, parameter, gradient, eta):
+        squares, scratch = self.squares[k], self.scratch[k]
+        np.multiply(gradient, gradient, out=scratch)
+        scratch *= 1 - self.decay
+        squares *= self.decay
+        squares += scratch
+        np.sqrt(squares, out=scratch)
+        scratch += self.epsilon
+        gradient /= scratch
+        gradient *= eta
+        parameter -= gradient
+
+
+class Adam(GradientDescent):
+
+    # m = beta1 * m + (1 - beta1) * g, v = beta2 * v + (1 - beta2) * g², p -= eta * m_hat / (sqrt(v_hat) + epsilon), with the moving averages m and v corrected for their zero initialization
+
+    def __init__(self, net, beta1 = 0.9, beta2 = 0.999, epsilon = 1e-8):
+        GradientDescent.__init__(self, net)
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.t = 0
+        self.means = self.state()
+        self.squares = self.state()
+        self.scratch = self.state()
+
+    def step(self, parameters, gradients, eta, batch_size):
+        self.t += 1
+        GradientDescent.step(self, parameters, gradients, eta, batch_size)
+
+    def update(self, k, parameter, gradient, eta):
+        means, squares, scratch = self.means[k], self.squares[k], self.scratch[k]
+        np.multiply(gradient, 1 - self.beta1, out=scratch)
+        means *= self.beta1
+        means += scratch
+        np.multiply(gradient, gradient, out=scratch)
+        scratch *= 1 - self.beta2
+        squares *= self.beta2
+        squares += scratch
+        np.sqrt(squares, out=scratch)
+        scratch *= 1 / np.sqrt(1 - self.beta2 ** self.t)
+        scratch += self.epsilon
+        np.divide(means, scratch, out=gradient)
+        gradient *= eta / (1 - self.beta1 ** self.t)
+        parameter -= gradient
+
+
+OPTIMIZERS = {
+    'sgd': GradientDescent,
+    'momentum': Momentum,
+    'nesterov': Nesterov,
+    'rmsprop': RMSProp,
+    'adam': Adam,
+}
+
+# Usual starting learning rates of the optimizers on the mnist data
+DEFAULT_ETAS = {
+    'sgd': 3,
+    'momentum': 0.3,
+    'nesterov': 0.3,
+    'rmsprop': 0.001,
+    'adam': 0.001,
+}
+
+
+def make_optimizer(optimizer, net):
+    # Returns the optimizer instance for an optimizer name, or the given optimizer instance
+    if isinstance(optimizer, str):
+        if optimizer not in OPTIMIZERS:
+            raise ValueError("unknown optimizer '{}', expected one of {}".format(optimizer, tuple(OPTIMIZERS)))
+        return OPTIMIZERS[optimizer](net)
+    return optimizer
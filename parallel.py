@@ -0,0 +1,212 @@
+# -*- coding:utf-8 -*-
+
+"""
+Data-parallel training of a network instance on a pool of worker processes.
+The weights and biases live in a multiprocessing.shared_memory block which the workers attach to, so that they are never pickled at each step.
+Two modes are available :
+    - 'sync' : each mini-batch is split between the workers, which write the gradient of their share into their own shared gradient buffers, and the main process averages them and updates the parameters
+    - 'hogwild' : whole mini-batches are handed to the workers, which update the shared parameters in place without any lock
+The workers are spawned rather than forked (the training can run on a worker thread of a GUI process, whose toolkit and BLAS state a forked child would copy with the other threads' locks) : the training data is pickled to each of them when they start.
+An exception raised by a worker is sent back to the main process and raised there, with the worker's traceback.
+It is used through the "processes" and "parallel_mode" arguments of Network.SGD
+"""
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import pickle
+import queue
+import traceback
+import numpy as np
+from network import Network, Workspace, is_indexable_data
+
+PARALLEL_MODES = ('sync', 'hogwild')
+# Seconds between two checks that the workers are alive while waiting for their results, and longest wait for a worker to exit when the training stops
+RESULT_POLL_INTERVAL = 1
+WORKER_JOIN_TIMEOUT = 10
+
+
+class RemoteTraceback(Exception):
+
+    # The traceback of an exception raised in a worker process, chained to the exception raised again in the main process (like concurrent.futures does)
+
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+class SharedArrays():
+
+    # A list of arrays stored one after the other in a single shared memory block, which other processes attach to by its name
+
+    def __init__(self, shapes, dtype, name = None):
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.dtype = np.dtype(dtype)
+        nbytes = [int(np.prod(shape)) * self.dtype.itemsize for shape in self.shapes]
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=max(sum(nbytes), 1))
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.arrays = []
+        offset = 0
+        for shape, size in zip(self.shapes, nbytes):
+            self.arrays.append(np.ndarray(shape, dtype=self.dtype, buffer=self.memory.buf, offset=offset))
+            offset += size
+
+    def close(self):
+        # Every view on the block must have been released before closing it
+        self.arrays = []
+        self.memory.close()
+
+
+class ParallelTrainer():
+
+    def __init__(self, net, training_data, processes, mode = 'sync', dropout_value = None, optimizer = None):
+        if mode not in PARALLEL_MODES:
+            raise ValueError("unknown parallel mode '{}', expected one of {}".format(mode, PARALLEL_MODES))
+        if optimizer and mode == 'hogwild':
+            raise ValueError("the hogwild workers update the parameters themselves with plain gradient descent : use the 'sync' mode with an optimizer")
+        if not is_indexable_data(training_data):
+            raise ValueError("parallel training needs a list or arrays of training examples, not a stream")
+        self.net = net
+        self.mode = mode
+        self.processes = int(processes)
+        self.dropout_value = dropout_value
+        self.optimizer = optimizer
+        self.workspace = Workspace(net.sizes, net.dtype)
+        self.pending = 0
+        self.next_worker = 0
+        self.failed = False
+        # The network's parameters are moved into the shared memory block for the whole training
+        shapes = [b.shape for b in net.biases] + [w.shape for w in net.weights]
+        self.parameters = SharedArrays(shapes, net.dtype)
+        for array, shared in zip(net.biases + net.weights, self.parameters.arrays):
+            shared[...] = array
+        n_layers = len(net.biases)
+        net.biases, net.weights = self.parameters.arrays[:n_layers], self.parameters.arrays[n_layers:]
+        # Each worker owns a slot of gradient buffers in synchronous mode
+        self.gradients = [SharedArrays(shapes, net.dtype) for k in range(self.processes)] if mode == 'sync' else []
+        settings = (net.sizes, net.activation_function_name, net.regu_name, net.cost_name, net.dtype, shapes, mode, dropout_value)
+        context = mp.get_context('spawn')
+        self.results = context.Queue()
+        self.tasks = []
+        self.workers = []
+        for k in range(self.processes):
+            tasks = context.Queue()
+            gradients_name = self.gradients[k].memory.name if self.gradients else None
+            worker = context.Process(target=worker_loop, args=(k, settings, self.parameters.memory.name, gradients_name, training_data, tasks, self.results, np.random.randint(2**31)), daemon=True)
+            worker.start()
+            self.tasks.append(tasks)
+            self.workers.append(worker)
+
+    def step(self, indexes, eta):
+        # Trains the network on the mini-batch of the given example indexes
+        if self.mode == 'sync':
+            shards = [shard for shard in np.array_split(indexes, self.processes) if len(shard)]
+            for k, shard in enumerate(shards):
+                self.tasks[k].put((shard, eta))
+            for k in range(len(shards)):
+                self.result()
+            nabla_b, nabla_w = self.workspace.nabla_b, self.workspace.nabla_w
+            for l, nabla in enumerate(nabla_b + nabla_w):
+                np.copyto(nabla, self.gradients[0].arrays[l])
+                for gradients in self.gradients[1:len(shards)]:
+                    nabla += gradients.arrays[l]
+            if self.optimizer:
+                self.optimizer.step(self.net.biases + self.net.weights, nabla_b + nabla_w, eta, len(indexes))
+            else:
+                for b, w, nb, nw in zip(self.net.biases, self.net.weights, nabla_b, nabla_w):
+                    nb *= eta / len(indexes)
+                    nw *= eta / len(indexes)
+                    b -= nb
+                    w -= nw
+        else:
+            # At most two mini-batches per worker are waiting to be computed
+            if self.pending >= 2 * self.processes:
+                self.result()
+                self.pending -= 1
+            self.tasks[self.next_worker].put((indexes, eta))
+            self.next_worker = (self.next_worker + 1) % self.processes
+            self.pending += 1
+
+    def wait(self):
+        # Waits until every mini-batch handed to the workers has been applied to the parameters
+        while self.pending:
+            self.result()
+            self.pending -= 1
+
+    def result(self):
+        # Waits for the result of a task, and raises the exception of a worker which failed, or an error if a worker died
+        while True:
+            try:
+                result = self.results.get(timeout=RESULT_POLL_INTERVAL)
+                break
+            except queue.Empty:
+                for k, worker in enumerate(self.workers):
+                    if not worker.is_alive():
+                        self.failed = True
+                        raise RuntimeError("the worker process {} exited unexpectedly (exit code {})".format(k, worker.exitcode))
+        if result[0] == 'error':
+            self.failed = True
+            index, exception, tb = result[1:]
+            raise exception from RemoteTraceback("\n(in the worker process {})\n{}".format(index, tb))
+
+    def stop(self):
+        # Stops the workers and gives the network back its own (unshared) parameters
+        # The shared memory blocks are always released, even when a worker failed (the workers which don't exit are then terminated)
+        try:
+            if not self.failed:
+                self.wait()
+        finally:
+            for tasks in self.tasks:
+                tasks.put(None)
+            for worker in self.workers:
+                worker.join(WORKER_JOIN_TIMEOUT)
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+            n_layers = len(self.net.biases)
+            arrays = [array.copy() for array in self.parameters.arrays]
+            self.net.biases, self.net.weights = arrays[:n_layers], arrays[n_layers:]
+            for shared in [self.parameters] + self.gradients:
+                shared.close()
+                shared.memory.unlink()
+
+
+def worker_loop(index, settings, parameters_name, gradients_name, training_data, tasks, results, seed):
+    sizes, activation_function_name, regu_name, cost_name, dtype, shapes, mode, dropout_value = settings
+    # Each worker draws its own dropout masks
+    np.random.seed(seed)
+    net = Network("worker_{}".format(index), sizes, activation_function_name, regu_name, dtype, cost_name)
+    parameters = SharedArrays(shapes, dtype, parameters_name)
+    n_layers = len(sizes) - 1
+    net.biases, net.weights = parameters.arrays[:n_layers], parameters.arrays[n_layers:]
+    gradients = SharedArrays(shapes, dtype, gradients_name) if gradients_name else None
+    workspace = Workspace(sizes, dtype)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        indexes, eta = task
+        try:
+            x, y = net.select_mini_batch(training_data, indexes, workspace)
+            if mode == 'sync':
+                nabla_b, nabla_w = net.backprop(x, y, dropout_value, workspace)
+                for l, nabla in enumerate(nabla_b + nabla_w):
+                    np.copyto(gradients.arrays[l], nabla)
+            else:
+                net.update_stacked_mini_batch(x, y, eta, dropout_value, workspace)
+        except Exception as exception:
+            # The exception is sent back to the main process, which raises it (an exception which can't be pickled is sent as a RuntimeError)
+            try:
+                pickle.dumps(exception)
+            except Exception:
+                exception = RuntimeError(repr(exception))
+            results.put(('error', index, exception, traceback.format_exc()))
+            continue
+        results.put(('done', index))
+    net.biases, net.weights = [], []
+    parameters.close()
+    if gradients:
+        gradients.close()
@@ -0,0 +1,52 @@
+# -*- coding:utf-8 -*-
+
+"""
+Plots of the trainings, drawn with matplotlib.
+This module is only imported when a graph is drawn (by Network.SGD when there is test data), so that importing the network module stays cheap and works without a display
+"""
+
+import threading
+import numpy as np
+from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
+from math import ceil
+plt.ion()
+
+
+def plot_accuracy_graph(net, mini_batch_size, eta, fpe, accuracies, training_num, dropout_value):
+    if threading.current_thread() is threading.main_thread():
+        fig = plt.figure('Training graph',figsize = (8, 8))
+    else:
+        # pyplot's windows belong to the main thread : a training running on another thread (started by the GUI for instance) only saves its graph
+        fig = Figure(figsize = (8, 8))
+    axes = fig.gca()
+    x = range(len(accuracies))
+    axes.plot(x, accuracies)
+    if not dropout_value:
+        dropout_value = ""
+    else:
+        dropout_value = ", dropout : " + str(dropout_value)
+    axes.set_title("Training of the model \"{0}\" ({1}): batch size : {2}, starting learning rate : {3}{4}".format(net.id, net.activation_function_name, mini_batch_size, eta, dropout_value))
+    axes.set_xlabel("Epoch completions")
+    axes.set_ylabel("Accuracy (measured on the test data)")
+    axes.set_ylim([0, 100])
+    ticks = np.array(range(0, len(accuracies), fpe))
+    axes.set_xticks(ticks)
+    axes.set_xticklabels(np.array(ticks/fpe, dtype='int'))
+    axes.set_yticks(range(0,101,10))
+    annot_max(x, np.array(accuracies), axes, fpe)
+    fig.savefig("trainings/training_{}/training_graph".format(str(training_num)))
+
+
+#plot max annotation
+def annot_max(x, y, ax, fpe):
+    xmax = x[np.argmax(y)]
+    ymax = y.max()
+    text = "max accuracy = {:.2f}%, at epoch {}".format(ymax, ceil(xmax / fpe))
+    if not ax:
+        ax=plt.gca()
+    bbox_props = dict(boxstyle="square,pad=0.3", fc="w", ec="k", lw=0.72)
+    arrowprops=dict(arrowstyle="->",connectionstyle="angle,angleA=0,angleB=60")
+    kw = dict(xycoords='data',textcoords="axes fraction",
+            arrowprops=arrowprops, bbox=bbox_props, ha="right", va="top")
+    ax.annotate(text, xy=(xmax, ymax), xytext=(0.9, 0.85), **kw)
@@ -0,0 +1,110 @@
+# -*- coding:utf-8 -*-
+
+"""
+Hot-path instrumentation of the training : a Profiler measures the cumulative time and the number of calls of each phase of the training (and optionally its peak memory with tracemalloc), and exports every phase call as a Chrome trace (readable by chrome://tracing or https://ui.perfetto.dev).
+The trace keeps the last max_events phase calls (the cumulative timers count all of them), so that the memory of a long training's profile stays bounded.
+When profiling is disabled, the training uses NULL_PROFILER, whose phases do nothing.
+"""
+
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# About 25 MB of trace events at most (tens of thousands of mini-batches' phases)
+MAX_TRACE_EVENTS = 200000
+
+
+class Profiler():
+
+    def __init__(self, trace_memory = False, max_events = MAX_TRACE_EVENTS):
+        self.trace_memory = trace_memory
+        self.totals = {}
+        self.counts = {}
+        self.peaks = {}
+        self.events = collections.deque(maxlen=max_events)
+        self.origin = time.perf_counter()
+        # The memory tracing started by the caller is left running when the profiler stops
+        self.started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.record(name, start, end)
+            if self.trace_memory:
+                self.peaks[name] = max(self.peaks.get(name, 0), tracemalloc.get_traced_memory()[1] - memory_start)
+
+    def timed(self, iterable, name):
+        # Yields the items of the iterable, timing the production of each one as a call of the phase "name"
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.record(name, start, time.perf_counter())
+            yield item
+
+    def record(self, name, start, end):
+        self.totals[name] = self.totals.get(name, 0) + end - start
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.events.append((name, start, end))
+
+    def stop(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def dropped_events(self):
+        # The number of phase calls which the trace doesn't hold anymore
+        return sum(self.counts.values()) - len(self.events)
+
+    def summary(self):
+        lines = ["\nTraining profile (cumulative time per phase) :"]
+        total = sum(self.totals.values())
+        for name in sorted(self.totals, key=self.totals.get, reverse=True):
+            line = "- {0} : {1:.3f}s ({2:.1f}%), {3} call(s), {4:.3f}ms per call".format(name, self.totals[name], 100 * self.totals[name] / total if total else 0, self.counts[name], 1000 * self.totals[name] / self.counts[name])
+            if name in self.peaks:
+                line += ", peak memory {:.2f} MiB".format(self.peaks[name] / 2**20)
+            lines.append(line)
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path):
+        # Writes the phase calls as "complete" events of the Chrome trace event format (timestamps in microseconds)
+        pid, tid = os.getpid(), threading.get_ident()
+        events = [{'name': name, 'cat': 'training', 'ph': 'X', 'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6, 'pid': pid, 'tid': tid} for name, start, end in self.events]
+        with open(path, "w") as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'peak_memory_bytes': self.peaks, 'dropped_events': self.dropped_events()}}, file)
+
+
+class NullProfiler():
+
+    # The profiler used when profiling is disabled : a phase is a shared no-op context manager
+
+    def __init__(self):
+        self.null_phase = contextlib.nullcontext()
+
+    def phase(self, name):
+        return self.null_phase
+
+    def timed(self, iterable, name):
+        return iterable
+
+    def __bool__(self):
+        return False
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,206 @@
+# -*- coding:utf-8 -*-
+
+"""
+Iterative magnitude pruning of a trained network : the smallest weights (in absolute value) of each layer are set to zero over several steps, the network being fine-tuned after each step with its pruned weights kept at zero (by the "masks" argument of Network.SGD).
+The layers whose share of nonzero weights drops below a density threshold, and which have enough neurons for their sparse product to be faster than the dense one, are then stored as CSRMatrix objects (compressed sparse rows : the nonzero weights, their column indexes and the start of each row),
+which replace their dense arrays in net.weights. The other pruned layers keep their dense arrays, with zeros in place of the pruned weights.
+numpy has no sparse matrix product (and scipy isn't a requirement of the library) : a single input (one column) is fed forward by gathering the inputs of the nonzero weights, which is faster than the dense product for layers of SPARSE_MIN_ROWS neurons and more,
+and a batch by gathering, for each row, the inputs of its nonzero weights, which are multiplied by them with BLAS. Measured on 784 inputs, the batched sparse product is about as fast as the dense one for batches of 1000 inputs at 5% density,
+but about twice slower at 10% density or for small batches (the report of Network.prune gives both latencies).
+It is used through Network.prune (which returns a report of the FLOPs, latencies, memory and accuracy before and after the pruning), Network.sparsify and Network.densify
+"""
+
+import time
+import numpy as np
+from network import is_array_data
+from reporting import report
+
+# The layers with at most 10% of nonzero weights are stored as sparse matrices
+SPARSE_DENSITY_THRESHOLD = 0.1
+# ... when they have at least 500 neurons : measured on 784 inputs and a single input, the sparse product of a layer at 10% density (or less) is slower than the dense one up to 100 to 300 neurons, and clearly faster from 500 neurons
+SPARSE_MIN_ROWS = 500
+# Number of examples fed forward at once to measure the batch latency
+LATENCY_BATCH_SIZE = 1000
+
+
+class CSRMatrix():
+
+    def __init__(self, data, indices, indptr, shape):
+        # The nonzero weights of row i are data[indptr[i]:indptr[i+1]], in the columns indices[indptr[i]:indptr[i+1]]
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = tuple(shape)
+        # np.add.reduceat sums the rows from their starts, and gives an empty row the value at its start instead of 0 : only the nonempty rows are reduced
+        self.nonempty_rows = np.flatnonzero(np.diff(indptr))
+        self.row_starts = indptr[self.nonempty_rows]
+        # The columns and the weights of each nonempty row, for the batched products
+        self.rows = [(indices[start:end], data[start:end]) for start, end in zip(indptr[self.nonempty_rows], indptr[self.nonempty_rows + 1])]
+
+    @classmethod
+    def from_dense(cls, w):
+        w = np.asarray(w)
+        rows, columns = np.nonzero(w)
+        indptr = np.zeros(w.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=w.shape[0]), out=indptr[1:])
+        return cls(w[rows, columns], columns.astype(np.int32), indptr, w.shape)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    @property
+    def density(self):
+        return self.nnz / (self.shape[0] * self.shape[1])
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.indices.nbytes + self.indptr.nbytes
+
+    def toarray(self):
+        w = np.zeros(self.shape, dtype=self.dtype)
+        w[np.repeat(np.arange(self.shape[0]), np.diff(self.indptr)), self.indices] = self.data
+        return w
+
+    def __array__(self, dtype = None, copy = None):
+        # np.asarray gives the dense matrix (for the quantization of a pruned network for instance)
+        w = self.toarray()
+        return w if dtype is None else w.astype(dtype, copy=False)
+
+    def dot(self, x):
+        # Product with a (columns, m) matrix, like ndarray.dot
+        x = np.asarray(x)
+        if x.ndim == 2 and x.shape[1] != 1:
+            z = np.zeros((self.shape[0], x.shape[1]), dtype=np.result_type(self.dtype, x.dtype))
+            for i, (columns, weights) in zip(self.nonempty_rows, self.rows):
+                np.dot(weights, x.take(columns, axis=0), out=z[i])
+            return z
+        products = x.reshape(-1).take(self.indices)
+        products *= self.data
+        if len(self.nonempty_rows) == self.shape[0]:
+            z = np.add.reduceat(products, self.row_starts)
+        else:
+            z = np.zeros(self.shape[0], dtype=products.dtype)
+            if self.nnz:
+                z[self.nonempty_rows] = np.add.reduceat(products, self.row_starts)
+        return z.reshape((self.shape[0],) + x.shape[1:])
+
+    def __repr__(self):
+        return "CSRMatrix({}x{}, {} nonzero weights, density = {:.2%})".format(self.shape[0], self.shape[1], self.nnz, self.density)
+
+
+def magnitude_mask(w, sparsity):
+    # Returns the boolean mask of the weights kept when the "sparsity" share of the smallest weights (in absolute value) of the layer are pruned
+    w = np.asarray(w)
+    mask = np.zeros(w.shape, dtype=bool)
+    kept = int(round((1 - sparsity) * w.size))
+    if kept > 0:
+        mask.flat[np.argpartition(np.abs(w), w.size - kept, axis=None)[w.size - kept:]] = True
+    return mask
+
+
+def sparsify(net, density_threshold = SPARSE_DENSITY_THRESHOLD, layers = None, min_rows = SPARSE_MIN_ROWS):
+    # Stores the layers (all of them by default) of at least "min_rows" neurons with at most "density_threshold" nonzero weights as CSRMatrix objects, and returns the indexes of the sparse layers
+    sparse_layers = []
+    for l, w in enumerate(net.weights):
+        if isinstance(w, np.ndarray) and (layers is None or l in layers) and w.shape[0] >= min_rows and np.count_nonzero(w) <= density_threshold * w.size:
+            net.weights[l] = CSRMatrix.from_dense(w)
+        if not isinstance(net.weights[l], np.ndarray):
+            sparse_layers.append(l)
+    return sparse_layers
+
+
+def densify(net):
+    # Stores the sparse layers as dense arrays again, to train them
+    net.weights = [w if isinstance(w, np.ndarray) else w.toarray() for w in net.weights]
+
+
+def prune(net, training_data, sparsity, steps = 4, epochs = 1, mini_batch_size = 10, eta = 3, validation_data = None, layers = (0,), density_threshold = SPARSE_DENSITY_THRESHOLD, **sgd_arguments):
+    # Prunes the "sparsity" share of the weights of the given layers (indexes in net.weights) in "steps" steps, the pruned share growing by equal parts,
+    # and fine-tunes the network on the training data for "epochs" epochs after each step (the other SGD arguments are given to Network.SGD)
+    # Only the first layer is pruned by default : it holds most of the weights (a pruned layer of less than SPARSE_MIN_ROWS neurons keeps its dense array, and its dense product)
+    # The inference costs and the accuracy on the validation data (if given) are measured before and after the pruning, the latencies on inputs of the validation data (or else of the training data)
+    if not 0 <= sparsity < 1:
+        raise ValueError("the sparsity must be in [0, 1), got {}".format(sparsity))
+    output = sgd_arguments.get('reporter') or sgd_arguments.get('gui')
+    densify(net)
+    layers = list(layers)
+    inputs = sample_inputs(validation_data if validation_data is not None else training_data)
+    before = inference_profile(net, inputs, validation_data)
+    masks = [None] * len(net.weights)
+    for step in range(1, steps + 1):
+        step_sparsity = sparsity * step / steps
+        for l in layers:
+            masks[l] = magnitude_mask(net.weights[l], step_sparsity)
+            net.weights[l] *= masks[l]
+        txt = "\nPruning step {}/{} : {:.1%} of the weights of the layers {} are pruned".format(step, steps, step_sparsity, layers)
+        report(txt, output)
+        if epochs:
+            net.SGD(training_data, epochs, mini_batch_size, eta, masks = masks, **sgd_arguments)
+    sparse_layers = sparsify(net, density_threshold, layers)
+    after = inference_profile(net, inputs, validation_data)
+    return {'sparsity': sparsity, 'steps': steps, 'sparse_layers': sparse_layers, 'densities': layer_densities(net), 'before': before, 'after': after}
+
+
+def layer_densities(net):
+    return [w.density if isinstance(w, CSRMatrix) else np.count_nonzero(w) / w.size for w in net.weights]
+
+
+def flops(net):
+    # Floating point operations computed by the layers' products for a single input : a multiplication and an addition per weight of the dense layers (the pruned ones included), per nonzero weight of the sparse ones
+    return sum(2 * (w.nnz if isinstance(w, CSRMatrix) else w.size) for w in net.weights)
+
+
+def effective_flops(net):
+    # Floating point operations of the nonzero weights for a single input, the ones a sparse product of every layer would compute
+    return sum(2 * (w.nnz if isinstance(w, CSRMatrix) else np.count_nonzero(w)) for w in net.weights)
+
+
+def sample_inputs(data, n = LATENCY_BATCH_SIZE):
+    # Returns (at most) n inputs of the data as a (784, n) matrix
+    if is_array_data(data):
+        return np.ascontiguousarray(data[0][:n].T)
+    return np.hstack([x for x, y in list(data)[:n]])
+
+
+def latency(function, x, repeat = 20):
+    # The best time of "repeat" calls, which is the least disturbed by the other processes
+    function(x)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(x)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def inference_profile(net, inputs, validation_data = None):
+    profile = {
+        'flops': flops(net),
+        'effective_flops': effective_flops(net),
+        'single_latency': latency(net.feedforward, inputs[:, :1], 200),
+        'batch_latency': latency(net.feedforward, inputs),
+        'batch_size': inputs.shape[1],
+        'bytes': sum(w.nbytes for w in net.weights) + sum(b.nbytes for b in net.biases),
+    }
+    if validation_data is not None:
+        profile['accuracy'] = 100 * net.evaluate(validation_data) / len(validation_data[0] if is_array_data(validation_data) else validation_data)
+    return profile
+
+
+def format_report(report):
+    before, after = report['before'], report['after']
+    txt = ("Pruning ({:.1%} of the weights in {} steps, layer densities : {}, sparse layers : {}) :\n"
+           "FLOPs of a single input : {} -> {} computed ({:.1f}x fewer), {} -> {} of the nonzero weights ({:.1f}x fewer)\n"
+           "Latency of a single input : {:.1f}us -> {:.1f}us, of a batch of {} inputs : {:.2f}ms -> {:.2f}ms\n"
+           "Model memory : {} -> {} bytes").format(report['sparsity'], report['steps'], ", ".join("{:.1%}".format(density) for density in report['densities']), report['sparse_layers'],
+                                                   before['flops'], after['flops'], before['flops'] / max(after['flops'], 1), before['effective_flops'], after['effective_flops'], before['effective_flops'] / max(after['effective_flops'], 1),
+                                                   1e6 * before['single_latency'], 1e6 * after['single_latency'], before['batch_size'], 1e3 * before['batch_latency'], 1e3 * after['batch_latency'],
+                                                   before['bytes'], after['bytes'])
+    if 'accuracy' in before:
+        txt += "\nAccuracy : {:.2f}% -> {:.2f}%".format(before['accuracy'], after['accuracy'])
+    return txt
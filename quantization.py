@@ -0,0 +1,151 @@
+# -*- coding:utf-8 -*-
+
+"""
+Post-training quantization of a trained network for inference : the weights of each layer are stored as int8 values with one float32 scale per row (per neuron), which divides the size of a float64 model file by 8.
+A QuantizedNetwork feeds its inputs forward with integer products : the activations entering each layer are quantized to int8 values too (with one scale per example), their products with the weights are accumulated exactly,
+and the sums are only then rescaled to float32 for the biases and the activation function.
+numpy has no integer matrix product kernel (its int32 matmul is about 20 times slower than BLAS) : the int8 products are accumulated by the float32 BLAS product, whose sums of integers are exact below 2**24 (layers of up to 1040 inputs), float64 being used for wider layers.
+The int8 weights are widened to that dtype once, when the quantized network is created or loaded, rather than at each product : in memory, a quantized network holds half the weights' memory of a float64 one.
+It is used through quantize(net), quantization_report(net, quantized, validation_data), QuantizedNetwork.save and Network.load, which reads the quantized model files back
+"""
+
+import numpy as np
+from network import Network, write_model_file, is_array_data, data_length
+
+QUANTIZATION = 'int8_per_row'
+QUANTIZED_FORMAT_VERSION = 2
+INT8_MAX = 127
+
+
+class QuantizedNetwork():
+
+    # Inference only network : its outputs are float32 activations
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, id, sizes, activation_function_name, regu_name, biases, weights, scales, cost_name = 'quadratic'):
+        # weights are the int8 arrays of the layers, scales their float32 (rows, 1) scales, biases float32 columns
+        self.id = str(id)
+        self.sizes = list(sizes)
+        self.num_layers = len(self.sizes)
+        self.activation_function_name = activation_function_name
+        self.regu_name = regu_name
+        self.cost_name = cost_name
+        self.biases = biases
+        self.weights = weights
+        self.scales = scales
+        # The accumulation dtype of each layer, in which the sums of int8 products are exact integers
+        self.accumulators = [np.dtype(np.float32) if w.shape[1] * INT8_MAX ** 2 < 2 ** 24 else np.dtype(np.float64) for w in weights]
+        # The int8 weights (the stored ones) widened to the accumulation dtypes for the BLAS products
+        self.product_weights = [w.astype(accumulator) for w, accumulator in zip(weights, self.accumulators)]
+
+    # The activation functions, the output regulation and the evaluation are the float network's ones
+    activation_function = Network.activation_function
+    regu = Network.regu
+    softmax_output = Network.softmax_output
+    feedforward_batch = Network.feedforward_batch
+    evaluate = Network.evaluate
+
+    def feedforward(self, x):
+        x = np.asarray(x)
+        softmax_output = self.softmax_output()
+        for k, (w, scale, b, accumulator) in enumerate(zip(self.product_weights, self.scales, self.biases, self.accumulators)):
+            q, x_scales = quantize_columns(x, accumulator)
+            z = np.dot(w, q)
+            z *= scale
+            z *= x_scales
+            x = z.astype(self.dtype, copy=False)
+            x += b
+            if not (softmax_output and k == self.num_layers - 2):
+                x = self.activation_function(x, out=x)
+        return self.regu(x, out=x)
+
+    def nbytes(self):
+        # The size of the stored model (its int8 weights)
+        return sum(array.nbytes for array in self.weights + self.scales + self.biases)
+
+    def inference_nbytes(self):
+        # The memory of the inference, which also holds the widened weights
+        return self.nbytes() + sum(w.nbytes for w in self.product_weights)
+
+    def save(self, path):
+        # Writes the quantized model in a model file (read back by Network.load), with its int8 weights and their scales
+        header = {'id': self.id, 'sizes': self.sizes, 'activation_function_name': self.activation_function_name, 'regu_name': self.regu_name, 'cost_name': self.cost_name, 'dtype': self.dtype.str, 'quantization': QUANTIZATION}
+        arrays = [('biases', b) for b in self.biases] + [('weights', w) for w in self.weights] + [('scales', s) for s in self.scales]
+        # Older versions of the library, which can't read the int8 weights, refuse the file instead of loading a wrong model
+        write_model_file(path, header, arrays, QUANTIZED_FORMAT_VERSION)
+
+    @classmethod
+    def from_model_file(cls, header, arrays):
+        if header['quantization'] != QUANTIZATION:
+            raise ValueError("unknown quantization '{}'".format(header['quantization']))
+        return cls(header['id'], header['sizes'], header['activation_function_name'], header['regu_name'], arrays['biases'], arrays['weights'], arrays['scales'], header.get('cost_name', 'quadratic'))
+
+    def __repr__(self):
+        return "\"" + str(self.id) + "\" : " + str(self.sizes) + ", activation function : " + str(self.activation_function_name) + ", output regulation method : " + str(self.regu_name) + ", cost function : " + str(self.cost_name) + ", quantization : " + QUANTIZATION
+
+
+def quantize(net):
+    # Returns the int8 quantized inference version of a trained network
+    weights, scales = zip(*[quantize_rows(w) for w in net.weights])
+    biases = [b.astype(np.float32) for b in net.biases]
+    return QuantizedNetwork(net.id, net.sizes, net.activation_function_name, net.regu_name, biases, list(weights), list(scales), getattr(net, 'cost_name', 'quadratic'))
+
+
+def quantize_rows(w):
+    # Symmetric quantization of each row : w ~ q * scale, with q in [-127, 127] and scale = max(|row|) / 127 (rows of zeros keep a scale of 1)
+    w = np.asarray(w, dtype=np.float64)
+    scales = np.max(np.abs(w), axis=1, keepdims=True) / INT8_MAX
+    scales[scales == 0] = 1
+    q = np.rint(w / scales)
+    np.clip(q, -INT8_MAX, INT8_MAX, out=q)
+    return q.astype(np.int8), scales.astype(np.float32)
+
+
+def quantize_columns(x, dtype = np.float32):
+    # Symmetric quantization of each column (each example) of the activations : returns the int8 values (held in a "dtype" array for the BLAS product) and the (1, columns) scales
+    # The values are computed in place in a copy of the activations, and need no clipping : the largest one of each column is scaled to 127 exactly
+    q = np.array(x, dtype=dtype)
+    scales = np.maximum(np.max(q, axis=0, keepdims=True), -np.min(q, axis=0, keepdims=True))
+    scales *= 1 / INT8_MAX
+    scales[scales == 0] = 1
+    q /= scales
+    np.rint(q, out=q)
+    return q, scales
+
+
+def quantization_report(net, quantized, validation_data, chunk_size = 1000):
+    # Compares the quantized network with the float one on validation data (same formats as Network.evaluate) : accuracies, agreement of their predictions, output error and memory
+    if is_array_data(validation_data):
+        inputs, labels = validation_data
+        chunks = ((inputs[k:k+chunk_size].T, labels[k:k+chunk_size]) for k in range(0, len(inputs), chunk_size))
+    else:
+        validation_data = list(validation_data)
+        chunks = ((np.hstack([x for x,y in validation_data[k:k+chunk_size]]), np.array([y for x,y in validation_data[k:k+chunk_size]]).ravel()) for k in range(0, len(validation_data), chunk_size))
+    float_correct = quantized_correct = agreements = 0
+    max_output_error = 0.0
+    for x, chunk_labels in chunks:
+        float_outputs = net.feedforward(x)
+        quantized_outputs = quantized.feedforward(x)
+        float_predictions, quantized_predictions = np.argmax(float_outputs, axis=0), np.argmax(quantized_outputs, axis=0)
+        float_correct += int(np.sum(float_predictions == chunk_labels))
+        quantized_correct += int(np.sum(quantized_predictions == chunk_labels))
+        agreements += int(np.sum(float_predictions == quantized_predictions))
+        max_output_error = max(max_output_error, float(np.max(np.abs(float_outputs - quantized_outputs))))
+    n = data_length(validation_data)
+    float_bytes = sum(array.nbytes for array in net.weights + net.biases)
+    return {
+        'float_accuracy': 100 * float_correct / n,
+        'quantized_accuracy': 100 * quantized_correct / n,
+        'accuracy_delta': 100 * (quantized_correct - float_correct) / n,
+        'agreement': 100 * agreements / n,
+        'max_output_error': max_output_error,
+        'float_bytes': float_bytes,
+        'quantized_bytes': quantized.nbytes(),
+        'compression': float_bytes / quantized.nbytes(),
+        'quantized_inference_bytes': quantized.inference_nbytes(),
+    }
+
+
+def format_report(report):
+    return ("Quantization ({}) : accuracy {:.2f}% -> {:.2f}% (delta = {:+.2f} points), same prediction for {:.2f}% of the examples, max output error = {:.4f}\n"
+            "Model size : {} -> {} bytes ({:.1f}x smaller), memory of the quantized inference : {} bytes").format(QUANTIZATION, report['float_accuracy'], report['quantized_accuracy'], report['accuracy_delta'], report['agreement'], report['max_output_error'], report['float_bytes'], report['quantized_bytes'], report['compression'], report['quantized_inference_bytes'])
@@ -0,0 +1,180 @@
+# -*- coding:utf-8 -*-
+
+"""
+Registry of the trained models, in a SQLite database : one row per trained model with its model file, its architecture, its hyper-parameters and its metrics.
+The models are listed by indexed queries (by accuracy, architecture or training time) instead of rereading and sorting a text file,
+and each model is inserted in its own short transaction, so that many training processes (a sweep's workers for instance) can register their models at the same time.
+
+Usage (from the root of the project) :
+    python registry.py [models/hd_recognition/registry.sqlite] [--sizes 784,30,10] [--activation sigmoid] [--order-by accuracy|training_time|created] [--limit 20]
+    python registry.py [registry] --import-ladder models/hd_recognition/accuracy_ladder.md (registers the models of an accuracy ladder text file)
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+
+# Registry of the handwritten digits recognition models
+HD_REGISTRY = "models/hd_recognition/registry.sqlite"
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS models (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        path TEXT,
+        sizes TEXT NOT NULL,
+        activation_function_name TEXT,
+        regu_name TEXT,
+        cost_name TEXT,
+        accuracy REAL,
+        training_time REAL,
+        hyper_parameters TEXT NOT NULL DEFAULT '{}',
+        metrics TEXT NOT NULL DEFAULT '{}',
+        created REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS models_by_accuracy ON models (accuracy DESC)",
+    "CREATE INDEX IF NOT EXISTS models_by_architecture ON models (sizes, activation_function_name, accuracy DESC)",
+    "CREATE INDEX IF NOT EXISTS models_by_training_time ON models (training_time)",
+    "CREATE INDEX IF NOT EXISTS models_by_date ON models (created)",
+]
+
+# Orders of the listings (each one read from its index) : the best models first (the ones without accuracy last), the fastest to train first (among the timed ones), the latest first
+ORDERS = {
+    'accuracy': "accuracy DESC",
+    'training_time': "training_time ASC",
+    'created': "created DESC",
+}
+
+
+class ModelRegistry():
+
+    def __init__(self, path = HD_REGISTRY, timeout = 30):
+        # A writer waits up to "timeout" seconds for the other writers to finish their transaction
+        # A registry object (like its SQLite connection) belongs to the thread which created it : each thread or process opens its own
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.row_factory = sqlite3.Row
+        # In write-ahead logging mode, the listings never wait for the insertions and the other way around
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def register(self, net, accuracy, path = None, training_time = None, hyper_parameters = None, metrics = None):
+        # Inserts a trained model with its accuracy (in %), its model file's path, its training time (in seconds) and dictionaries of hyper-parameters and metrics, and returns its registry id
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO models (name, path, sizes, activation_function_name, regu_name, cost_name, accuracy, training_time, hyper_parameters, metrics, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (net.id, path, architecture(net.sizes), net.activation_function_name, net.regu_name, getattr(net, 'cost_name', 'quadratic'), accuracy, training_time,
+                 json.dumps(hyper_parameters or {}, default=str), json.dumps(metrics or {}, default=str), time.time()))
+        return cursor.lastrowid
+
+    def models(self, sizes = None, activation_function_name = None, min_accuracy = None, max_training_time = None, order_by = 'accuracy', limit = None):
+        # Returns the registered models matching the filters as dictionaries, the best ones first (or sorted by 'training_time' or 'created')
+        if order_by not in ORDERS:
+            raise ValueError("unknown order '{}', expected one of {}".format(order_by, tuple(ORDERS)))
+        conditions, parameters = [], []
+        if order_by == 'training_time':
+            conditions.append("training_time IS NOT NULL")
+        if sizes is not None:
+            conditions.append("sizes = ?")
+            parameters.append(architecture(sizes))
+        if activation_function_name is not None:
+            conditions.append("activation_function_name = ?")
+            parameters.append(activation_function_name)
+        if min_accuracy is not None:
+            conditions.append("accuracy >= ?")
+            parameters.append(min_accuracy)
+        if max_training_time is not None:
+            conditions.append("training_time <= ?")
+            parameters.append(max_training_time)
+        query = "SELECT * FROM models"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY " + ORDERS[order_by]
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(int(limit))
+        return [model_row(row) for row in self.connection.execute(query, parameters)]
+
+    def best(self, **filters):
+        # Returns the most accurate registered model matching the filters (see models), or None
+        models = self.models(limit = 1, **filters)
+        return models[0] if models else None
+
+    def ladder(self, limit = None, **filters):
+        # The registered models as the lines of an accuracy ladder, from the best one
+        return "\n".join(describe(model) for model in self.models(limit = limit, **filters))
+
+    def import_ladder(self, ladder_path):
+        # Registers the models of an accuracy ladder text file ('"name" : [sizes], activation function : ..., output regulation method : ... --> accuracy = ...%' lines), and returns their number
+        # The model files named after the models (name.model or name.pickle) next to the ladder are registered with them
+        pattern = re.compile(r'"(?P<name>.*)" : (?P<sizes>\[[\d, ]*\]), activation function : (?P<activation>\w+), output regulation method : (?P<regu>\w+)(?:, cost function : (?P<cost>\w+))?\s*(?:-->|,) accuracy = (?P<accuracy>[\d.]+)%?')
+        count = 0
+        with open(ladder_path, "r") as ladder, self.connection:
+            for line in ladder:
+                match = pattern.match(line.strip())
+                if not match:
+                    continue
+                paths = [os.path.join(os.path.dirname(ladder_path), match['name'] + extension) for extension in (".model", ".pickle")]
+                path = next((path for path in paths if os.path.exists(path)), None)
+                self.connection.execute(
+                    "INSERT INTO models (name, path, sizes, activation_function_name, regu_name, cost_name, accuracy, metrics, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (match['name'], path, architecture(json.loads(match['sizes'])), match['activation'], None if match['regu'] == 'None' else match['regu'], match['cost'] or 'quadratic',
+                     float(match['accuracy']), json.dumps({'imported_from': ladder_path}), time.time()))
+                count += 1
+        return count
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+def architecture(sizes):
+    # The sizes are stored as a JSON list, in one canonical spelling so that they can be compared (and indexed)
+    return json.dumps([int(size) for size in sizes])
+
+
+def model_row(row):
+    model = dict(row)
+    for column in ('sizes', 'hyper_parameters', 'metrics'):
+        model[column] = json.loads(model[column])
+    return model
+
+
+def describe(model):
+    line = "\"{}\" : {}, activation function : {}, output regulation method : {}, cost function : {} --> accuracy = {}%".format(model['name'], model['sizes'], model['activation_function_name'], model['regu_name'], model['cost_name'], model['accuracy'])
+    if model['training_time'] is not None:
+        line += " (trained in {:.0f}s)".format(model['training_time'])
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registry of the trained models")
+    parser.add_argument("registry", nargs="?", default=HD_REGISTRY, help="SQLite registry file")
+    parser.add_argument("--import-ladder", help="register the models of an accuracy ladder text file")
+    parser.add_argument("--sizes", help="only list the models of these layer sizes (comma separated)")
+    parser.add_argument("--activation", help="only list the models of this activation function")
+    parser.add_argument("--order-by", default="accuracy", choices=list(ORDERS))
+    parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+    with ModelRegistry(args.registry) as registry:
+        if args.import_ladder:
+            print("{} model(s) imported from {}".format(registry.import_ladder(args.import_ladder), args.import_ladder))
+        sizes = [int(size) for size in args.sizes.split(",")] if args.sizes else None
+        print(registry.ladder(args.limit, sizes = sizes, activation_function_name = args.activation, order_by = args.order_by))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -*- coding:utf-8 -*-
+
+"""
+Live rendering of the first layer's weights during the training, in a separate process so that the training never waits for matplotlib.
+The training hands copies of the weights to a WeightRenderer, whose process updates the images of a figure drawn once, saves a PNG snapshot of each state, and appends it to the training animation GIF (written frame by frame with Pillow).
+It is used through the "display_weights" argument of Network.SGD
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import warnings
+from math import ceil, sqrt
+
+# Longest wait (in seconds) for the renderer to finish the remaining snapshots and the GIF when the training ends
+RENDERER_STOP_TIMEOUT = 120
+
+
+class WeightRenderer():
+
+    def __init__(self, directory, gif_name = 'training_animation', frame_duration = 200, max_pending = 32):
+        # The snapshots are saved in "directory", max_pending is the number of snapshots which can wait to be rendered before new ones are dropped
+        self.directory = directory
+        self.gif_path = os.path.join(directory, gif_name + ".gif")
+        self.dropped = 0
+        # The renderer process is spawned rather than forked : the training can run on a worker thread of a GUI process (see reporting.TrainingChannel), whose toolkit state and other threads' locks a forked child would copy
+        # A spawned process imports the main module again, the scripts training with display_weights must therefore guard their code with if __name__ == '__main__'
+        context = mp.get_context('spawn')
+        self.snapshots = context.Queue(max_pending)
+        self.process = context.Process(target=renderer_loop, args=(directory, self.gif_path, frame_duration, self.snapshots), daemon=True)
+        self.process.start()
+
+    def add(self, weights):
+        # Hands a copy of the weights to the renderer, dropping it if the renderer is too late rather than blocking the training
+        try:
+            self.snapshots.put_nowait(weights.copy())
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        # Waits for the rendering of the remaining snapshots and the writing of the GIF
+        # A renderer process which died (with a full queue) or which is stuck doesn't block the end of the training : it is terminated after RENDERER_STOP_TIMEOUT seconds
+        if self.process.is_alive():
+            try:
+                self.snapshots.put(None, timeout=RENDERER_STOP_TIMEOUT)
+            except queue.Full:
+                pass
+        self.process.join(RENDERER_STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        if self.process.exitcode != 0:
+            # The snapshots which the renderer will never read must not keep the training process from exiting
+            self.snapshots.cancel_join_thread()
+
+
+class GifWriter():
+
+    # Writes a looping GIF animation frame by frame (Pillow's save(save_all=True) keeps every frame in memory until the end), each frame with its own palette
+
+    def __init__(self, path, frame_duration):
+        self.path = path
+        self.frame_duration = frame_duration
+        self.file = None
+
+    def add(self, frame):
+        # frame is a palette ('P' mode) image
+        from PIL import GifImagePlugin
+        if self.file is None:
+            self.file = open(self.path, "wb")
+            header, _ = GifImagePlugin.getheader(frame, info={'loop': 0, 'duration': self.frame_duration})
+            for chunk in header:
+                self.file.write(chunk)
+        for chunk in GifImagePlugin.getdata(frame, duration=self.frame_duration, include_color_table=True):
+            self.file.write(chunk)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.write(b";")
+            self.file.close()
+            self.file = None
+
+
+def renderer_loop(directory, gif_path, frame_duration, snapshots):
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from PIL import Image
+    plt.ion()
+    fig = None
+    gif = GifWriter(gif_path, frame_duration)
+    count = 0
+    while True:
+        weights = snapshots.get()
+        if weights is None:
+            break
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            if fig is None:
+                # The figure and one image per neuron of the first layer are created once, the following snapshots only change their data
+                fig_size = ceil(sqrt(len(weights)))
+                fig = plt.figure("Weights live training", figsize = (fig_size, fig_size))
+                fig.suptitle("Weights live training (first hidden layer)", fontsize=16)
+                images = []
+                for j,neuron_weights in enumerate(weights):
+                    axes = fig.add_subplot(fig_size, fig_size, j + 1)
+                    axes.get_xaxis().set_visible(False)
+                    axes.get_yaxis().set_visible(False)
+                    images.append(axes.imshow(neuron_weights.reshape(28,28), cmap='Greys'))
+                plt.show()
+            else:
+                for image,neuron_weights in zip(images, weights):
+                    image.set_data(neuron_weights.reshape(28,28))
+                    image.set_clim(neuron_weights.min(), neuron_weights.max())
+            fig.canvas.draw()
+            fig.canvas.flush_events()
+        fig.savefig(os.path.join(directory, "snapshot_{}".format(count)))
+        # The frames are reduced to an adaptive palette and appended to the GIF as they come
+        gif.add(Image.fromarray(np.asarray(fig.canvas.buffer_rgba())[..., :3]).convert('P', palette=Image.Palette.ADAPTIVE))
+        count += 1
+    gif.close()
+    if fig is not None:
+        plt.close(fig)
@@ -0,0 +1,81 @@
+# -*- coding:utf-8 -*-
+
+"""
+Reporting of the training's messages, printed on the standard output, written in the output text widget of the GUI, or handed to a reporter.
+It doesn't import tkinter : the GUI object given to Network.SGD brings its own widgets, so that a headless training never loads a graphical toolkit.
+A TrainingChannel is the reporter of a training running on another thread than the GUI : the messages go through a bounded queue which the GUI drains when it has the time (with Tk's after loop),
+and the GUI can pause or cancel the training through it. It is used through the "reporter" argument of Network.SGD
+"""
+
+import queue
+import threading
+
+
+def report(txt, output = None):
+    # Hands the message to a reporter (any object with a report method), or writes it in the output widget of a GUI and scrolls to it, or prints it
+    if output is None:
+        print(txt)
+    elif hasattr(output, 'report'):
+        output.report(txt)
+    else:
+        output.output.insert("end", txt)
+        output.update_idletasks()
+        output.output.see("end")
+
+
+class TrainingChannel():
+
+    def __init__(self, max_messages = 1000):
+        # max_messages is the number of messages which can wait for the GUI before new ones are dropped
+        self.messages = queue.Queue(max_messages)
+        self.dropped = 0
+        self.running = threading.Event()
+        self.running.set()
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+
+    def report(self, txt):
+        # Called by the training thread : it never waits for the GUI, the messages being dropped (and counted) when the queue is full
+        try:
+            self.messages.put_nowait(txt)
+        except queue.Full:
+            self.dropped += 1
+
+    def drain(self, max_count = 100):
+        # Called by the GUI thread : returns (at most max_count of) the waiting messages without blocking
+        messages = []
+        while len(messages) < max_count:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def stop_reason(self):
+        # Called by the training between two mini-batches : waits while the training is paused, and returns the reason to stop if it is cancelled (None otherwise)
+        self.running.wait()
+        if self.cancelled.is_set():
+            return "cancelled by the user"
+        return None
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def paused(self):
+        return not self.running.is_set()
+
+    def cancel(self):
+        # A paused training is resumed so that it can stop
+        self.cancelled.set()
+        self.running.set()
+
+    def finish(self):
+        # Called by the training thread once it has nothing more to report
+        self.finished.set()
+
+    def done(self):
+        # Tells the GUI that the training is over and all its messages are drained
+        return self.finished.is_set() and self.messages.empty()
@@ -0,0 +1,217 @@
+# -*- coding:utf-8 -*-
+
+"""
+Prediction service for a saved model : the model is loaded once, and predictions are served over a local HTTP port or Unix socket.
+The concurrent requests are gathered by a MicroBatcher, which feeds them forward together as the columns of a single batch, waiting at most "max_latency" seconds for a batch to fill up.
+
+Usage (from the root of the project) :
+    python serving.py models/hd_recognition/model.model [--port 8000 | --unix-socket /tmp/network.sock] [--max-batch-size 64] [--max-latency-ms 2] [--mmap]
+
+Requests :
+    - POST /predict with a JSON body {"input": [784 values]}, or with a binary body (Content-Type: application/octet-stream) of 784 greyscale bytes (0 to 255) or 784 float32 values
+      answers {"prediction": <index of the most activated output neuron>, "activations": [output activations]}
+    - GET /stats answers the counters of the service (requests, batches, mean batch size, throughput, latency percentiles)
+"""
+
+import argparse
+import collections
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from network import Network
+
+# Length of the servers' queue of connections waiting to be accepted (socketserver's default of 5 resets the connections of bursts of concurrent clients before they reach the MicroBatcher)
+REQUEST_QUEUE_SIZE = 128
+
+
+class MicroBatcher():
+
+    def __init__(self, net, max_batch_size = 64, max_latency = 0.002, latency_window = 10000):
+        # latency_window is the number of latest requests the latency percentiles are computed on
+        self.net = net
+        self.max_batch_size = int(max_batch_size)
+        self.max_latency = max_latency
+        self.requests = queue.Queue()
+        # The inputs of a batch are stacked as the columns of a buffer allocated once
+        self.inputs = np.zeros((net.sizes[0], self.max_batch_size), dtype=net.dtype)
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.n_requests = 0
+        self.n_batches = 0
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def predict(self, x):
+        # Returns the output activations of the network for the input x, computed in the next batch (called from the request threads)
+        request = {'input': x, 'done': threading.Event(), 'time': time.perf_counter()}
+        self.requests.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['output']
+
+    def loop(self):
+        while True:
+            batch = [self.requests.get()]
+            # The batch is closed when it is full, or when its first request has waited max_latency seconds
+            deadline = time.perf_counter() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            m = len(batch)
+            try:
+                for j, request in enumerate(batch):
+                    self.inputs[:, j] = request['input']
+                outputs = self.net.feedforward(self.inputs[:, :m])
+                for j, request in enumerate(batch):
+                    request['output'] = outputs[:, j].copy()
+            except Exception as error:
+                for request in batch:
+                    request['error'] = error
+            end = time.perf_counter()
+            with self.lock:
+                self.n_requests += m
+                self.n_batches += 1
+                self.latencies.extend(end - request['time'] for request in batch)
+            for request in batch:
+                request['done'].set()
+
+    def stats(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1e3
+            uptime = time.perf_counter() - self.start_time
+            return {
+                'requests': self.n_requests,
+                'batches': self.n_batches,
+                'mean_batch_size': self.n_requests / self.n_batches if self.n_batches else 0,
+                'uptime_s': uptime,
+                'requests_per_second': self.n_requests / uptime,
+                'latency_ms_p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'latency_ms_p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+                'max_batch_size': self.max_batch_size,
+                'max_latency_ms': self.max_latency * 1e3,
+            }
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+
+    # HTTP/1.1 keeps the connections open between the requests of a client
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # The headers and the body of an answer are sent separately : on TCP, Nagle's algorithm would hold the body back until the client acknowledges the headers
+        self.disable_nagle_algorithm = not isinstance(self.server, socketserver.UnixStreamServer)
+        BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.answer(200, self.server.batcher.stats())
+        else:
+            self.answer(404, {'error': "unknown path {}".format(self.path)})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self.answer(404, {'error': "unknown path {}".format(self.path)})
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            x = self.parse_input(body)
+        except ValueError as error:
+            self.answer(400, {'error': str(error)})
+            return
+        activations = self.server.batcher.predict(x)
+        self.answer(200, {'prediction': int(np.argmax(activations)), 'activations': activations.tolist()})
+
+    def parse_input(self, body):
+        n_inputs = self.server.batcher.net.sizes[0]
+        if self.headers.get('Content-Type') == "application/octet-stream":
+            if len(body) == n_inputs:
+                return np.frombuffer(body, dtype=np.uint8) / 255
+            if len(body) == 4 * n_inputs:
+                return np.frombuffer(body, dtype=np.float32)
+            raise ValueError("a binary input must hold {} bytes or {} float32 values".format(n_inputs, n_inputs))
+        try:
+            x = np.asarray(json.loads(body)['input'], dtype=np.float64).ravel()
+        except (KeyError, TypeError, json.JSONDecodeError):
+            raise ValueError("the JSON body must be an object with an \"input\" list")
+        if len(x) != n_inputs:
+            raise ValueError("the input must hold {} values, not {}".format(n_inputs, len(x)))
+        return x
+
+    def answer(self, status, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header('Content-Type', "application/json")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # The clients of a Unix socket have no address
+        return str(self.client_address[0]) if self.client_address else "unix socket"
+
+    def log_message(self, format, *args):
+        # The requests are counted in /stats rather than logged one by one
+        pass
+
+
+class PredictionHTTPServer(ThreadingHTTPServer):
+
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+
+def serve(model_path, host = "127.0.0.1", port = 8000, unix_socket = None, max_batch_size = 64, max_latency = 0.002, mmap_mode = None):
+    # Loads the model and serves its predictions until the server is interrupted
+    net = Network.load(model_path, mmap_mode)
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, PredictionHandler)
+        address = "unix socket {}".format(unix_socket)
+    else:
+        server = PredictionHTTPServer((host, port), PredictionHandler)
+        address = "http://{}:{}".format(host, server.server_address[1])
+    server.batcher = MicroBatcher(net, max_batch_size, max_latency)
+    print("Serving the predictions of {} on {}".format(net, address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prediction service of a saved model")
+    parser.add_argument("model", help="model file saved by Network.save (or pickled Network)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket", help="serve on this Unix socket path instead of a TCP port")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-latency-ms", type=float, default=2, help="longest time a request waits for its batch to fill up")
+    parser.add_argument("--mmap", action="store_true", help="memory-map the model file instead of reading it")
+    args = parser.parse_args()
+    serve(args.model, args.host, args.port, args.unix_socket, args.max_batch_size, args.max_latency_ms / 1e3, 'r' if args.mmap else None)
+
+
+if __name__ == "__main__":
+    main()
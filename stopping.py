@@ -0,0 +1,67 @@
+# -*- coding:utf-8 -*-
+
+"""
+Stopping criteria of the training, so that no epoch is spent on a model which has stopped improving or has already reached its goal.
+An EarlyStopping tells the training to stop :
+    - when the monitored metric (the test accuracy, or the test cost) hasn't improved for "patience" evaluations
+    - when the test accuracy reaches "target_accuracy"
+    - when the training has run for "max_time" seconds
+    - when the training has seen "max_samples" training examples
+It is used through the "patience", "target_accuracy", "max_time", "max_samples" and "monitor" arguments of Network.SGD
+"""
+
+import time
+
+MONITORS = ('accuracy', 'cost')
+
+
+class EarlyStopping():
+
+    def __init__(self, patience = None, target_accuracy = None, max_time = None, max_samples = None, monitor = 'accuracy', min_delta = 0):
+        # An improvement of the monitored metric must be larger than min_delta to reset the patience
+        if monitor not in MONITORS:
+            raise ValueError("unknown monitored metric '{}', expected one of {}".format(monitor, MONITORS))
+        self.patience = patience
+        self.target_accuracy = target_accuracy
+        self.max_time = max_time
+        self.max_samples = max_samples
+        self.monitor = monitor
+        self.min_delta = min_delta
+        self.best = None
+        self.waited = 0
+        self.samples = 0
+        self.start()
+
+    def start(self):
+        # The wall-clock budget counts from here
+        self.start_time = time.perf_counter()
+
+    def needs_evaluations(self):
+        return self.patience is not None or self.target_accuracy is not None
+
+    def score(self, accuracy, cost):
+        # The monitored metric, as a score to maximize
+        return accuracy if self.monitor == 'accuracy' else -cost
+
+    def budget_reason(self, samples):
+        # Called after each mini-batch of "samples" examples : returns the reason to stop if a budget is spent, None otherwise
+        self.samples += samples
+        if self.max_samples is not None and self.samples >= self.max_samples:
+            return "{} training examples seen (max_samples = {})".format(self.samples, self.max_samples)
+        if self.max_time is not None and time.perf_counter() - self.start_time >= self.max_time:
+            return "{:.1f}s of training (max_time = {}s)".format(time.perf_counter() - self.start_time, self.max_time)
+        return None
+
+    def evaluation_reason(self, accuracy, cost = None):
+        # Called after each evaluation on the whole test data : returns the reason to stop if the target is reached or the patience is exhausted, None otherwise
+        if self.target_accuracy is not None and accuracy >= self.target_accuracy:
+            return "target accuracy reached ({}% >= {}%)".format(accuracy, self.target_accuracy)
+        score = self.score(accuracy, cost)
+        if self.best is None or score > self.best + self.min_delta:
+            self.best = score
+            self.waited = 0
+            return None
+        self.waited += 1
+        if self.patience is not None and self.waited >= self.patience:
+            return "no improvement of the test {} for {} evaluations (patience = {})".format(self.monitor, self.waited, self.patience)
+        return None
@@ -0,0 +1,143 @@
+# -*- coding:utf-8 -*-
+
+"""
+Hyper-parameter sweeps : every configuration of a grid of hyper-parameters is trained on a pool of worker processes, and the weak configurations are dropped early by successive halving.
+Each round (or "rung") trains the remaining configurations up to a number of epochs, evaluates them on the validation data, and keeps only the best 1/reduction of them for the next round, which trains them "reduction" times longer.
+With a registry, the workers register the result of every trial of every round in it (see the registry module).
+"""
+
+import itertools
+import multiprocessing as mp
+import time
+from math import ceil
+import numpy as np
+from network import Network, Workspace, data_length, is_array_data, mini_batch_indexes
+from optimizers import make_optimizer
+
+# The hyper-parameters a grid can tune, with their default values (the sizes have to be given)
+SWEEP_DEFAULTS = {
+    'activation_function_name': 'sigmoid',
+    'regu_name': None,
+    'cost_name': 'quadratic',
+    'eta': 3,
+    'mini_batch_size': 10,
+    'dropout_value': None,
+    'optimizer': None,
+}
+
+# Training data of the pool's worker processes, set once by their initializer
+worker_data = {}
+
+
+def configurations(grid):
+    # Lists every combination of the grid's values, a grid being a dictionnary of hyper-parameter name -> list of values
+    for name in grid:
+        if name != 'sizes' and name not in SWEEP_DEFAULTS:
+            raise ValueError("unknown hyper-parameter '{}'".format(name))
+    if 'sizes' not in grid:
+        raise ValueError("the grid must give the 'sizes' of the networks")
+    names = list(grid)
+    configs = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        config = dict(SWEEP_DEFAULTS)
+        config.update(zip(names, values))
+        configs.append(config)
+    return configs
+
+
+def successive_halving(training_data, validation_data, grid, min_epochs = 0.25, max_epochs = 4, reduction = 2, processes = None, dtype = np.float64, verbose = True, registry = None):
+    # Returns the trials of the last round sorted from the best validation accuracy, each trial being a dictionnary with the 'config', its 'accuracy', the 'epochs' it was trained for, its 'training_time' and the trained 'net'
+    # The training and validation data can be lists of (x, y) tuples or (inputs, outputs) arrays, like for Network.SGD and Network.evaluate
+    # "registry" is the path of a models registry in which the results of the trials are registered
+    if not is_list_or_arrays(training_data):
+        training_data = list(training_data)
+    if not is_list_or_arrays(validation_data):
+        validation_data = list(validation_data)
+    trials = [{'id': k, 'config': config, 'net': None, 'optimizer': None, 'examples': 0, 'epochs': 0, 'training_time': 0, 'accuracy': None, 'dtype': dtype} for k, config in enumerate(configurations(grid))]
+    epochs = min_epochs
+    rung = 0
+    if processes == 1:
+        init_worker(training_data, validation_data, registry)
+        pool = None
+    else:
+        pool = mp.get_context().Pool(processes, initializer=init_worker, initargs=(training_data, validation_data, registry))
+    try:
+        while True:
+            rung += 1
+            budget = int(ceil(epochs * data_length(training_data)))
+            tasks = [(trial, budget) for trial in trials]
+            trials = pool.map(train_trial, tasks) if pool else [train_trial(task) for task in tasks]
+            trials.sort(key=lambda trial: trial['accuracy'], reverse=True)
+            if verbose:
+                print(rung_report(rung, epochs, trials))
+            if len(trials) == 1 or epochs >= max_epochs:
+                break
+            trials = trials[:max(1, len(trials) // reduction)]
+            epochs = min(epochs * reduction, max_epochs)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return trials
+
+
+def init_worker(training_data, validation_data, registry = None):
+    # Each worker draws its own random weights, permutations and dropout masks
+    np.random.seed()
+    worker_data['training'] = training_data
+    worker_data['validation'] = validation_data
+    worker_data['registry'] = registry
+
+
+def train_trial(task):
+    # Trains a trial's network until it has seen "budget" training examples, and evaluates it on the validation data
+    trial, budget = task
+    config = trial['config']
+    training_data, validation_data = worker_data['training'], worker_data['validation']
+    net = trial['net']
+    if net is None:
+        net = Network("sweep_{}".format(trial['id']), config['sizes'], config['activation_function_name'], config['regu_name'], trial['dtype'], config['cost_name'])
+    # The optimizer's state goes on from one round to the next with the trial
+    optimizer = trial['optimizer']
+    if optimizer is None and config['optimizer']:
+        optimizer = make_optimizer(config['optimizer'], net)
+    workspace = Workspace(net.sizes, net.dtype)
+    n = data_length(training_data)
+    examples = trial['examples']
+    start_time = time.perf_counter()
+    while examples < budget:
+        for indexes in mini_batch_indexes(n, config['mini_batch_size']):
+            x, y = net.select_mini_batch(training_data, indexes, workspace)
+            net.update_stacked_mini_batch(x, y, config['eta'], config['dropout_value'], workspace, optimizer=optimizer)
+            examples += len(indexes)
+            if examples >= budget:
+                break
+    trial = dict(trial)
+    trial['net'] = net
+    trial['optimizer'] = optimizer
+    trial['examples'] = examples
+    trial['epochs'] = examples / n
+    trial['training_time'] += time.perf_counter() - start_time
+    trial['accuracy'] = 100 * net.evaluate(validation_data) / data_length(validation_data)
+    if worker_data.get('registry'):
+        # Each worker registers its own results, the registry serializing the concurrent insertions
+        from registry import ModelRegistry
+        with ModelRegistry(worker_data['registry']) as models:
+            hyper_parameters = dict(config, epochs = trial['epochs'])
+            models.register(net, trial['accuracy'], training_time = trial['training_time'], hyper_parameters = hyper_parameters, metrics = {'sweep_trial': trial['id'], 'validation_accuracy': trial['accuracy']})
+    return trial
+
+
+def rung_report(rung, epochs, trials):
+    lines = ["\nRound {} : {} configuration(s) trained for {:.2f} epoch(s)".format(rung, len(trials), epochs)]
+    for trial in trials:
+        lines.append("- accuracy = {:.2f}% : {}".format(trial['accuracy'], describe(trial['config'])))
+    return "\n".join(lines)
+
+
+def describe(config):
+    return ", ".join("{} = {}".format(name, config[name]) for name in ['sizes'] + list(SWEEP_DEFAULTS))
+
+
+def is_list_or_arrays(data):
+    return isinstance(data, list) or is_array_data(data)